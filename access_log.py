@@ -0,0 +1,152 @@
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import RotatingFileHandler
+
+from flask import g, request
+
+from config import (ACCESS_LOG_BACKUP_COUNT, ACCESS_LOG_BATCH_SIZE, ACCESS_LOG_MAX_BYTES,
+                    ACCESS_LOG_PATH, ACCESS_LOG_QUEUE_SIZE)
+
+class AccessLog:
+    """
+    Structured JSON access log. Records are put on a bounded in-memory queue and written
+    in batches by a background thread, rotating the file at `max_bytes`. When the queue
+    is full records are dropped and counted instead of blocking the request, records
+    lost to write errors are counted as failed and the file is reopened for the next batch.
+    `{pid}` in the path is replaced by the process id, to give every worker its own file.
+    """
+    def __init__(self, path, queue_size=10000, batch_size=256, max_bytes=0, backup_count=0):
+        self.path = path
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.dropped = 0
+        self.failed = 0
+        self.written = 0
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def log(self, record):
+        self._start()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def close(self, timeout=5.0):
+        """Write out the queued records and stop the writer, waiting at most `timeout` seconds."""
+        if self._pid != os.getpid():
+            return
+        self._pid = None
+        if not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+    def _start(self):
+        # Threads don't survive a fork, start the writer on first use in every process
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(self.queue_size)
+            self._thread = threading.Thread(target=self._run, name='access-log', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+        atexit.register(self.close)
+
+    def _run(self):
+        handler = None
+        reported_drops = 0
+        reported_failures = 0
+        running = True
+        while running:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                running = False
+                batch = [record for record in batch if record is not None]
+
+            records = len(batch)
+            dropped, failed = self.dropped, self.failed
+            if dropped > reported_drops:
+                batch.append({'event': 'dropped', 'count': dropped - reported_drops})
+            if failed > reported_failures:
+                batch.append({'event': 'write_failed', 'count': failed - reported_failures})
+            try:
+                if handler is None:
+                    handler = RotatingFileHandler(self.path.format(pid=os.getpid()),
+                                                  maxBytes=self.max_bytes, backupCount=self.backup_count,
+                                                  encoding='utf-8')
+                handler.stream.write(''.join(json.dumps(record, default=str) + '\n' for record in batch))
+                handler.flush()
+                if self.max_bytes and handler.stream.tell() >= self.max_bytes:
+                    handler.doRollover()
+            except OSError:
+                # A full or stalled disk must not stop the writer, count the batch and retry with a fresh file
+                self.failed += records
+                if handler is not None:
+                    try:
+                        handler.close()
+                    except OSError:
+                        pass
+                    handler = None
+                continue
+            self.written += len(batch)
+            reported_drops, reported_failures = dropped, failed
+        if handler is not None:
+            handler.close()
+
+def _touched_ids():
+    """Actor and movie ids from the URL, or the JSON body for /associate."""
+    ids = {key: value for key, value in (request.view_args or {}).items()
+           if key in ('actor_id', 'movie_id')}
+    if request.endpoint == 'add_movie_to_actor':
+        body = request.get_json(silent=True)
+        if isinstance(body, dict):
+            ids.update({key: body.get(key) for key in ('actor_id', 'movie_id')})
+    return ids
+
+def setup_access_log(app, path=ACCESS_LOG_PATH):
+    """Log every request to `path`, if set. Returns the AccessLog."""
+    if not path:
+        return None
+    access_log = AccessLog(path, ACCESS_LOG_QUEUE_SIZE, ACCESS_LOG_BATCH_SIZE,
+                           ACCESS_LOG_MAX_BYTES, ACCESS_LOG_BACKUP_COUNT)
+
+    @app.before_request
+    def start_timer():
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def log_request(response):
+        payload = g.get('payload')
+        record = {
+            'time': datetime.now(timezone.utc).isoformat(),
+            'method': request.method,
+            'route': request.url_rule.rule if request.url_rule else None,
+            'path': request.path,
+            'status': response.status_code,
+            'latency_ms': round((time.perf_counter() - g.get('request_start', time.perf_counter())) * 1000, 3),
+            'sub': payload.get('sub') if payload else None
+        }
+        record.update(_touched_ids())
+        access_log.log(record)
+        return response
+
+    return access_log
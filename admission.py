@@ -0,0 +1,106 @@
+import threading
+import time
+
+from flask import abort, g, request
+
+from config import (ADMISSION_ASSOCIATE_LIMIT, ADMISSION_QUEUE_SIZE, ADMISSION_READ_LIMIT,
+                    ADMISSION_TIMEOUT, ADMISSION_WRITE_LIMIT)
+
+# Endpoints that are never queued, so the service stays observable under load; /admission still requires a token
+EXEMPT_ENDPOINTS = {'index', 'get_admission', 'static'}
+
+class ConcurrencyLimiter:
+    """
+    Lets at most `limit` requests run at once. Up to `queue_size` more wait in line for
+    at most `timeout` seconds, everything beyond that is turned away immediately.
+    """
+    def __init__(self, limit, queue_size, timeout):
+        self.limit = limit
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """Wait for a free slot, return False if the request should be shed."""
+        with self._condition:
+            if self.active < self.limit:
+                self.active += 1
+                self.admitted += 1
+                return True
+            if self.waiting >= self.queue_size:
+                self.rejected += 1
+                return False
+
+            self.waiting += 1
+            deadline = time.monotonic() + self.timeout
+            try:
+                while self.active >= self.limit:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timed_out += 1
+                        return False
+                    self._condition.wait(remaining)
+            finally:
+                self.waiting -= 1
+            self.active += 1
+            self.admitted += 1
+            return True
+
+    def release(self):
+        with self._condition:
+            self.active -= 1
+            self._condition.notify()
+
+    def format(self):
+        with self._condition:
+            return {
+                'limit': self.limit,
+                'active': self.active,
+                'waiting': self.waiting,
+                'queue_size': self.queue_size,
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out
+            }
+
+def route_class(endpoint, method):
+    """Classify a request as a read, a write or an association."""
+    if endpoint == 'add_movie_to_actor':
+        return 'associate'
+    if method in ('GET', 'HEAD'):
+        return 'read'
+    return 'write'
+
+def setup_admission(app, queue_size=ADMISSION_QUEUE_SIZE, timeout=ADMISSION_TIMEOUT):
+    """
+    Put a ConcurrencyLimiter per route class in front of the route handlers.
+    Shed requests are answered with a 503. Returns the limiters by route class.
+    """
+    limiters = {
+        'read': ConcurrencyLimiter(ADMISSION_READ_LIMIT, queue_size, timeout),
+        'write': ConcurrencyLimiter(ADMISSION_WRITE_LIMIT, queue_size, timeout),
+        'associate': ConcurrencyLimiter(ADMISSION_ASSOCIATE_LIMIT, queue_size, timeout)
+    }
+
+    @app.before_request
+    def admit_request():
+        if request.endpoint is None or request.endpoint in EXEMPT_ENDPOINTS \
+                or request.method == 'OPTIONS':
+            return
+        limiter = limiters[route_class(request.endpoint, request.method)]
+        if not limiter.acquire():
+            abort(503)
+        g.admission_limiter = limiter
+
+    @app.teardown_request
+    def release_request(exc):
+        limiter = g.pop('admission_limiter', None)
+        if limiter is not None:
+            limiter.release()
+
+    return limiters
@@ -1,78 +1,314 @@
-from flask import Flask, abort, jsonify, request
-from flask_migrate import Migrate, upgrade
+import os
 
+import click
+from flask import Flask, Response, abort, jsonify, request, stream_with_context
+
+from datetime import datetime
 from flask_cors import CORS
-from auth import requires_auth, AuthError
-from model import Actors, Movies, setup_db, db
+from auth import requires_auth, check_permissions, AuthError
+from model import Actors, Changes, Movies, setup_db, db, rebuild_summaries
+from access_log import setup_access_log
+from admission import setup_admission
+from bulk import EXPORT_COLUMNS, export_chunks, import_files
+from cache import TTLCache
+from compression import gzip_chunks, setup_compression
+from json_provider import FastJSONProvider
+from singleflight import SingleFlight
+from snapshot import build_snapshot, setup_snapshots
+from config import ADMISSION_RETRY_AFTER, MIGRATE_ON_STARTUP, SNAPSHOT_PATH, STATS_CACHE_TTL
 
 def create_app(test_config=False):
     """Create and configure an instance of the Flask application."""
     # Create and Configure
     app = Flask(__name__)
+    app.json = FastJSONProvider(app)
 
     setup_db(app)
 
-    migrate = Migrate(app, db)
+    # Flask-Migrate pulls in alembic, only import it when migrating or running `flask db`
+    if MIGRATE_ON_STARTUP or os.environ.get('FLASK_RUN_FROM_CLI') == 'true':
+        from flask_migrate import Migrate, upgrade
+        migrate = Migrate(app, db)
 
     # Run the upgrade, which will create the tables on startup
-    with app.app_context():
-        upgrade()
+    if MIGRATE_ON_STARTUP:
+        with app.app_context():
+            upgrade()
+
+    CORS(app, resources={r"/*": {"origins": "*"}}, expose_headers=['X-Total-Count'])
+
+    setup_compression(app)
+    setup_access_log(app)
+    limiters = setup_admission(app)
+    # Actor and movie reads are served from the mmapped catalog snapshot when one is configured
+    snapshots = setup_snapshots(app)
+
+    stats_cache = TTLCache(STATS_CACHE_TTL)
+    # Identical concurrent reads share one fetch and serialization
+    reads = SingleFlight()
+
+    @app.cli.command('rebuild-summaries')
+    def rebuild_summaries_command():
+        """Recompute the denormalized cast and filmography summaries."""
+        rebuild_summaries()
+        print('Summaries rebuilt.')
 
-    CORS(app, resources={r"/*": {"origins": "*"}})
+    @app.cli.command('build-snapshot')
+    @click.option('--path', default=SNAPSHOT_PATH, required=True, show_default=True,
+                  help='Snapshot file, replaced atomically.')
+    def build_snapshot_command(path):
+        """Write the read-only catalog snapshot served by the workers."""
+        build_snapshot(path)
+        print(f'Snapshot written to {path}.')
+
+    @app.cli.command('import-data')
+    @click.option('--actors', type=click.Path(exists=True, dir_okay=False),
+                  help='CSV or NDJSON file with name, age and gender.')
+    @click.option('--movies', type=click.Path(exists=True, dir_okay=False),
+                  help='CSV or NDJSON file with title and release_date.')
+    @click.option('--associations', type=click.Path(exists=True, dir_okay=False),
+                  help='CSV or NDJSON file with actor_name and movie_title.')
+    @click.option('--batch-size', default=1000, show_default=True,
+                  help='Rows sent to the database per COPY or executemany.')
+    def import_data_command(actors, movies, associations, batch_size):
+        """Bulk load actors, movies and associations from CSV or NDJSON files."""
+        import_files({
+            'actors': actors,
+            'movies': movies,
+            'associations': associations
+        }, batch_size=batch_size)
+
+    @app.cli.command('export-data')
+    @click.argument('table', type=click.Choice(list(EXPORT_COLUMNS)))
+    @click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), default='csv', show_default=True)
+    @click.option('--gzip', 'compress', is_flag=True, help='Gzip the output.')
+    @click.option('--after-id', type=int, help='Only export rows added after this id.')
+    @click.option('--since', type=click.DateTime(), help='Only export rows changed after this time.')
+    @click.option('--batch-size', default=1000, show_default=True,
+                  help='Rows fetched from the server-side cursor at a time.')
+    @click.option('--output', type=click.File('wb'), default='-', help='Output file, stdout by default.')
+    def export_data_command(table, fmt, compress, after_id, since, batch_size, output):
+        """Stream a whole table as CSV or NDJSON."""
+        if after_id is not None and table == 'movie_actors':
+            raise click.BadParameter('not supported for movie_actors, use --since', param_hint='--after-id')
+        chunks = export_chunks(table, fmt, after_id, since, batch_size)
+        if compress:
+            chunks = gzip_chunks(chunks)
+        for chunk in chunks:
+            output.write(chunk)
+
+    def export_response(table):
+        """Stream a table download, configured by the format, gzip, after_id and since query args."""
+        fmt = request.args.get('format', 'csv')
+        if fmt not in ('csv', 'ndjson'):
+            abort(400)
+        after_id = request.args.get('after_id', type=int)
+        if after_id is not None and table == 'movie_actors':
+            abort(400)
+        since = request.args.get('since')
+        if since is not None:
+            try:
+                since = datetime.fromisoformat(since)
+            except ValueError:
+                abort(400)
+        chunks = export_chunks(table, fmt, after_id, since)
+        mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+        filename = f'{table}.{fmt}'
+        if request.args.get('gzip', 'false').lower() == 'true':
+            chunks = gzip_chunks(chunks)
+            mimetype = 'application/gzip'
+            filename += '.gz'
+        return Response(stream_with_context(chunks), mimetype=mimetype, headers={
+            'Content-Disposition': f'attachment; filename={filename}'
+        })
 
     @app.route('/', methods=['GET'])
     def index():
         return jsonify({
             'message': 'Welcome to Casting Agency'
         })
+
+    @app.route('/admission', methods=['GET'])
+    @requires_auth(permission='get:movies', Test_config=test_config)
+    def get_admission(payload):
+        return jsonify({
+            'success': True,
+            'admission': {name: limiter.format() for name, limiter in limiters.items()}
+        })
         
     ## ROUTES GET /actors and /movies
-    @app.route('/actors', methods=['GET'])
+    def count_response(count_rows):
+        """Answer a HEAD request with just the X-Total-Count header, estimated if asked to."""
+        estimate = request.args.get('estimate', 'false').lower() == 'true'
+        return '', 200, {'X-Total-Count': str(count_rows(estimate=estimate))}
+
+    @app.route('/actors', methods=['GET', 'HEAD'])
     @requires_auth(permission='get:actors', Test_config=test_config)
+    @reads.coalesce
     def get_actors(payload):
-        actors = Actors.get_all_actors()
-        formatted_actors = [actor.format() for actor in actors]
+        if request.method == 'HEAD':
+            return count_response(Actors.count_actors)
+        snapshot = snapshots and snapshots.current()
+        if snapshot:
+            formatted_actors = snapshot.get_all_actors()
+        else:
+            actors = Actors.get_all_actors()
+            formatted_actors = [actor.format() for actor in actors]
 
         return jsonify({
             'success': True,
             'actors': formatted_actors
-        })
+        }), 200, {'X-Total-Count': str(len(formatted_actors))}
 
-    @app.route('/movies', methods=['GET'])
+    @app.route('/movies', methods=['GET', 'HEAD'])
     @requires_auth(permission='get:movies', Test_config=test_config)
+    @reads.coalesce
     def get_movies(payload):
-        movies = Movies.get_all_movies()
-        formatted_movies = [movie.format() for movie in movies]
+        if request.method == 'HEAD':
+            return count_response(Movies.count_movies)
+        snapshot = snapshots and snapshots.current()
+        if snapshot:
+            formatted_movies = snapshot.get_all_movies()
+        else:
+            movies = Movies.get_all_movies()
+            formatted_movies = [movie.format() for movie in movies]
 
         return jsonify({
             'success': True,
             'movies': formatted_movies
-        })
+        }), 200, {'X-Total-Count': str(len(formatted_movies))}
     
     @app.route('/actors/<int:actor_id>', methods=['GET'])
     @requires_auth(permission='get:actors', Test_config=test_config)
+    @reads.coalesce
     def get_actor(payload, actor_id):
-        actor = Actors.get_actor(actor_id)
-        if actor is None:
-            abort(404)
+        snapshot = snapshots and snapshots.current()
+        # Rows added since the snapshot was built are looked up in the database
+        formatted_actor = snapshot.get_actor(actor_id) if snapshot else None
+        if formatted_actor is None:
+            actor = Actors.get_actor(actor_id)
+            if actor is None:
+                abort(404)
+            formatted_actor = actor.format()
 
         return jsonify({
             'success': True,
-            'actor': actor.format()
+            'actor': formatted_actor
         })
     
     @app.route('/movies/<int:movie_id>', methods=['GET'])
     @requires_auth(permission='get:movies', Test_config=test_config)
+    @reads.coalesce
     def get_movie(payload, movie_id):
-        movie = Movies.get_movie(movie_id)
-        if movie is None:
-            abort(404)
+        snapshot = snapshots and snapshots.current()
+        formatted_movie = snapshot.get_movie(movie_id) if snapshot else None
+        if formatted_movie is None:
+            movie = Movies.get_movie(movie_id)
+            if movie is None:
+                abort(404)
+            formatted_movie = movie.format()
 
         return jsonify({
             'success': True,
-            'movie': movie.format()
+            'movie': formatted_movie
         })
     
+    ## ROUTES GET /stats
+    @app.route('/stats/cast-sizes', methods=['GET'])
+    @requires_auth(permission='get:movies', Test_config=test_config)
+    @reads.coalesce
+    def get_cast_sizes(payload):
+        cast_sizes = stats_cache.get_or_set('cast-sizes', Movies.get_cast_sizes)
+
+        return jsonify({
+            'success': True,
+            'cast_sizes': cast_sizes
+        })
+
+    @app.route('/stats/releases-per-year', methods=['GET'])
+    @requires_auth(permission='get:movies', Test_config=test_config)
+    @reads.coalesce
+    def get_releases_per_year(payload):
+        releases = stats_cache.get_or_set('releases-per-year', Movies.get_releases_per_year)
+
+        return jsonify({
+            'success': True,
+            'releases_per_year': releases
+        })
+
+    @app.route('/stats/movies-per-actor', methods=['GET'])
+    @requires_auth(permission='get:actors', Test_config=test_config)
+    @reads.coalesce
+    def get_movies_per_actor(payload):
+        movie_counts = stats_cache.get_or_set('movies-per-actor', Actors.get_movie_counts)
+
+        return jsonify({
+            'success': True,
+            'movies_per_actor': movie_counts
+        })
+
+    @app.route('/stats/age-distribution', methods=['GET'])
+    @requires_auth(permission='get:actors', Test_config=test_config)
+    @reads.coalesce
+    def get_age_distribution(payload):
+        distribution = stats_cache.get_or_set('age-distribution', Actors.get_age_distribution)
+
+        return jsonify({
+            'success': True,
+            'age_distribution': distribution
+        })
+
+    ## ROUTES GET /export
+    @app.route('/export/actors', methods=['GET'])
+    @requires_auth(permission='get:actors', Test_config=test_config)
+    def export_actors(payload):
+        return export_response('actors')
+
+    @app.route('/export/movies', methods=['GET'])
+    @requires_auth(permission='get:movies', Test_config=test_config)
+    def export_movies(payload):
+        return export_response('movies')
+
+    @app.route('/export/movie_actors', methods=['GET'])
+    @requires_auth(permission='get:movies', Test_config=test_config)
+    def export_movie_actors(payload):
+        return export_response('movie_actors')
+
+    ## ROUTES GET /changes
+    @app.route('/changes', methods=['GET'])
+    @requires_auth(permission='get:movies', Test_config=test_config)
+    @reads.coalesce
+    def get_changes(payload):
+        """
+        Page through the change feed. Pass the returned `next` as `since` to continue,
+        deleted rows are reported without a body.
+        """
+        if payload is not None:
+            check_permissions('get:actors', payload)
+        since = request.args.get('since', 0, type=int)
+        limit = min(request.args.get('limit', 100, type=int), 1000)
+        changes = Changes.get_changes(since, limit)
+
+        actor_ids = [c.row_id for c in changes if c.table_name == 'actors' and not c.deleted]
+        movie_ids = [c.row_id for c in changes if c.table_name == 'movies' and not c.deleted]
+        rows = {
+            'actors': {actor.id: actor for actor in Actors.get_actors(actor_ids)},
+            'movies': {movie.id: movie for movie in Movies.get_movies(movie_ids)}
+        }
+        formatted_changes = []
+        for change in changes:
+            formatted_change = change.format()
+            row = rows[change.table_name].get(change.row_id)
+            if row is not None:
+                formatted_change['row'] = row.format()
+            formatted_changes.append(formatted_change)
+
+        return jsonify({
+            'success': True,
+            'changes': formatted_changes,
+            'next': changes[-1].seq if changes else since
+        })
+
     ## ROUTES POST /actors and /movies
     @app.route('/actors', methods=['POST'])
     @requires_auth(permission='post:actors', Test_config=test_config)
@@ -258,6 +494,14 @@ def create_app(test_config=False):
             'message': 'Internal server error'
         }), 500
     
+    @app.errorhandler(503)
+    def service_unavailable(error):
+        return jsonify({
+            'success': False,
+            'error': 503,
+            'message': 'Service unavailable'
+        }), 503, {'Retry-After': str(ADMISSION_RETRY_AFTER)}
+
     @app.errorhandler(405)
     def method_not_allowed(error):
         return jsonify({
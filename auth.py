@@ -1,8 +1,6 @@
 import json
-from flask import request
+from flask import g, request
 from functools import wraps
-from jose import jwt
-from urllib.request import urlopen
 
 from config import AUTH_DOMAIN, ALGORITHMS, API_AUDIENCE
 
@@ -47,6 +45,10 @@ def check_permissions(permission, payload):
     return True
 
 def verify_decode_jwt(token):
+    # Imported on first use, so test configs and CLI commands don't pay for them
+    from jose import jwt
+    from urllib.request import urlopen
+
     # GET THE PUBLIC KEY FROM AUTH0
     jsonurl = urlopen(f'https://{AUTH_DOMAIN}/.well-known/jwks.json')
     jwks = json.loads(jsonurl.read())
@@ -117,6 +119,7 @@ def requires_auth(permission='', Test_config=False):
                 token = get_token_auth_header()
                 payload = verify_decode_jwt(token)
                 check_permissions(permission, payload)
+                g.payload = payload
             return f(payload, *args, **kwargs)
         return wrapper
     return requires_auth_decorator
\ No newline at end of file
@@ -0,0 +1,76 @@
+"""
+Micro-benchmark of the JSON providers over realistic GET /actors and GET /movies payloads.
+
+    python bench_json.py [--actors 2000] [--movies 500] [--repeat 20]
+
+Compares Flask's default provider with FastJSONProvider, with and without orjson.
+No database is needed, the payloads are built from unsaved model instances.
+"""
+import argparse
+import time
+from contextlib import nullcontext
+from datetime import datetime
+from unittest.mock import patch
+
+from flask import Flask
+
+import json_provider
+from json_provider import FastJSONProvider
+from model import Actors, Movies
+
+def build_payloads(actor_count, movie_count):
+    actors = []
+    for i in range(actor_count):
+        actor = Actors(name=f'Actor {i}', age=20 + i % 50, gender='Female' if i % 2 else 'Male')
+        actor.id = i + 1
+        actor.movie_titles = [f'Movie {(i + j) % movie_count}' for j in range(i % 8)]
+        actor.movie_count = len(actor.movie_titles)
+        actors.append(actor)
+    movies = []
+    for i in range(movie_count):
+        movie = Movies(title=f'Movie {i}', release_date=datetime(1990 + i % 35, 1 + i % 12, 1 + i % 28))
+        movie.id = i + 1
+        movie.cast_names = [f'Actor {(i * 7 + j) % actor_count}' for j in range(12)]
+        movie.cast_count = len(movie.cast_names)
+        movies.append(movie)
+    return {
+        'actors': {'success': True, 'actors': [actor.format() for actor in actors]},
+        'movies': {'success': True, 'movies': [movie.format() for movie in movies]}
+    }
+
+def bench(app, payload, repeat):
+    """Return the best time of `repeat` responses and the body size."""
+    best = float('inf')
+    with app.app_context():
+        for _ in range(repeat):
+            start = time.perf_counter()
+            body = app.json.response(payload).get_data()
+            best = min(best, time.perf_counter() - start)
+    return best, len(body)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--actors', type=int, default=2000)
+    parser.add_argument('--movies', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    payloads = build_payloads(args.actors, args.movies)
+    default_app = Flask(__name__)
+    fast_app = Flask(__name__)
+    fast_app.json = FastJSONProvider(fast_app)
+    providers = [('flask default', default_app, False), ('fast, stdlib json', fast_app, True)]
+    if json_provider.orjson is not None:
+        providers.append(('fast, orjson', fast_app, False))
+
+    for name, payload in payloads.items():
+        print(f'GET /{name} ({len(payload[name])} rows)')
+        baseline = None
+        for label, app, without_orjson in providers:
+            with patch('json_provider.orjson', None) if without_orjson else nullcontext():
+                seconds, size = bench(app, payload, args.repeat)
+            baseline = baseline or seconds
+            print(f'  {label:<18} {seconds * 1000:8.2f} ms  {size:>9} bytes  {baseline / seconds:5.1f}x')
+
+if __name__ == '__main__':
+    main()
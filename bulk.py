@@ -0,0 +1,187 @@
+import csv
+import io
+import json
+import time
+from datetime import datetime
+from itertools import islice
+
+from model import Actors, Changes, Movies, db, movie_actors, rebuild_summaries
+
+# Columns loaded for each kind of record, in file and COPY order
+IMPORT_COLUMNS = {
+    'actors': ('name', 'age', 'gender'),
+    'movies': ('title', 'release_date'),
+    'associations': ('actor_name', 'movie_title')
+}
+
+def read_records(path):
+    """Yield one dict per record of a CSV or NDJSON file, one line at a time."""
+    with open(path, newline='', encoding='utf-8') as file:
+        if path.endswith(('.ndjson', '.jsonl')):
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(file)
+
+def batched(records, size):
+    records = iter(records)
+    while batch := list(islice(records, size)):
+        yield batch
+
+def _parse_record(kind, record):
+    """Validate a record and return its values in IMPORT_COLUMNS order."""
+    if kind == 'actors':
+        return (record['name'], int(record['age']), record['gender'])
+    if kind == 'movies':
+        release_date = record['release_date']
+        if not isinstance(release_date, datetime):
+            release_date = datetime.fromisoformat(release_date)
+        return (record['title'], release_date)
+    return (record['actor_name'], record['movie_title'])
+
+def _copy_rows(connection, table, columns, rows):
+    """Load rows with PostgreSQL COPY through an in-memory CSV buffer."""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
+
+def _insert_rows(connection, table, columns, rows):
+    """Load rows with a batched executemany, for databases without COPY."""
+    connection.execute(table.insert(), [dict(zip(columns, row)) for row in rows])
+
+def _staging_table():
+    return db.Table('import_associations', db.MetaData(),
+        db.Column('actor_name', db.String),
+        db.Column('movie_title', db.String),
+        prefixes=['TEMPORARY']
+    )
+
+def _link_associations(connection, staging):
+    """
+    Resolve staged (actor_name, movie_title) pairs to ids and insert the missing links.
+    Duplicate names or titles resolve to the oldest row, unknown ones are skipped.
+    """
+    resolved = db.select(
+        db.select(db.func.min(Movies.id))
+            .where(Movies.title == staging.c.movie_title)
+            .scalar_subquery().label('movie_id'),
+        db.select(db.func.min(Actors.id))
+            .where(Actors.name == staging.c.actor_name)
+            .scalar_subquery().label('actor_id')
+    ).select_from(staging).subquery()
+    linked = db.exists().where(movie_actors.c.movie_id == resolved.c.movie_id,
+                               movie_actors.c.actor_id == resolved.c.actor_id)
+    pairs = db.select(resolved.c.movie_id, resolved.c.actor_id).distinct() \
+        .where(resolved.c.movie_id.is_not(None),
+               resolved.c.actor_id.is_not(None),
+               ~linked) \
+        .subquery()
+    # Linking changes the summaries of both sides
+    Changes.record('movies', db.select(pairs.c.movie_id).distinct())
+    Changes.record('actors', db.select(pairs.c.actor_id).distinct())
+    connection.execute(movie_actors.insert().from_select(['movie_id', 'actor_id'], db.select(pairs)))
+
+def import_records(kind, records, batch_size=1000):
+    """
+    Stream records of one kind into the database in batches of `batch_size`.
+    Uses COPY on PostgreSQL and executemany elsewhere. Returns the number of rows read.
+    """
+    connection = db.session.connection()
+    columns = IMPORT_COLUMNS[kind]
+    if kind == 'associations':
+        table = _staging_table()
+        table.create(connection)
+    else:
+        table = Actors.__table__ if kind == 'actors' else Movies.__table__
+        last_id = connection.scalar(db.select(db.func.max(table.c.id))) or 0
+    load = _copy_rows if connection.dialect.name == 'postgresql' else _insert_rows
+
+    count = 0
+    for batch in batched(records, batch_size):
+        rows = [_parse_record(kind, record) for record in batch]
+        load(connection, table, columns, rows)
+        count += len(rows)
+
+    if kind == 'associations':
+        _link_associations(connection, table)
+        table.drop(connection)
+    else:
+        Changes.record(kind, db.select(table.c.id).where(table.c.id > last_id))
+    return count
+
+def import_files(paths, batch_size=1000, report=print):
+    """
+    Import actors, movies and associations files in dependency order in one transaction,
+    then rebuild the denormalized summaries. `paths` maps a kind to a file path.
+    """
+    try:
+        for kind in IMPORT_COLUMNS:
+            path = paths.get(kind)
+            if path is None:
+                continue
+            start = time.perf_counter()
+            count = import_records(kind, read_records(path), batch_size)
+            elapsed = time.perf_counter() - start
+            report(f'Imported {count} {kind} in {elapsed:.2f}s '
+                   f'({count / elapsed if elapsed else count:.0f} rows/s)')
+        rebuild_summaries()
+    except:
+        db.session.rollback()
+        raise
+
+# Columns written for each exported table
+EXPORT_COLUMNS = {
+    'actors': ('id', 'name', 'age', 'gender'),
+    'movies': ('id', 'title', 'release_date'),
+    'movie_actors': ('movie_id', 'actor_id')
+}
+
+def _export_query(kind, after_id=None, since=None):
+    """
+    Select the exported columns of a table in primary key order. With `after_id`,
+    only rows added after that id are selected. movie_actors has no id of its own,
+    use `since` for it instead. With `since`, only rows created or updated after
+    that time are selected.
+    """
+    table = movie_actors if kind == 'movie_actors' else db.metadata.tables[kind]
+    query = db.select(*[table.c[column] for column in EXPORT_COLUMNS[kind]]) \
+        .order_by(*table.primary_key.columns)
+    if after_id is not None:
+        if kind == 'movie_actors':
+            raise ValueError('after_id is not supported for movie_actors, use since')
+        query = query.where(table.c.id > after_id)
+    if since is not None:
+        changed_at = table.c.created_at if kind == 'movie_actors' else table.c.updated_at
+        query = query.where(changed_at > since)
+    return query
+
+def export_rows(kind, after_id=None, since=None, batch_size=1000):
+    """Yield batches of rows of one table, fetched through a server-side cursor."""
+    result = db.session.execute(_export_query(kind, after_id, since),
+                                execution_options={'yield_per': batch_size})
+    yield from result.partitions()
+
+def _serialize(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def export_chunks(kind, fmt='csv', after_id=None, since=None, batch_size=1000):
+    """Yield a table as UTF-8 encoded CSV or NDJSON, one chunk per batch of rows."""
+    columns = EXPORT_COLUMNS[kind]
+    if fmt == 'csv':
+        yield (','.join(columns) + '\r\n').encode()
+    for rows in export_rows(kind, after_id, since, batch_size):
+        buffer = io.StringIO()
+        if fmt == 'csv':
+            csv.writer(buffer).writerows([[_serialize(value) for value in row] for row in rows])
+        else:
+            for row in rows:
+                buffer.write(json.dumps(dict(zip(columns, map(_serialize, row)))))
+                buffer.write('\n')
+        yield buffer.getvalue().encode()
@@ -0,0 +1,65 @@
+import gzip
+import hashlib
+import zlib
+
+from flask import request
+
+from cache import LRUCache
+from config import COMPRESS_CACHE_SIZE, COMPRESS_LEVEL, COMPRESS_MIN_SIZE
+
+COMPRESSIBLE_MIMETYPES = ('application/json', 'application/x-ndjson', 'text/csv', 'text/plain', 'text/html')
+
+def gzip_chunks(chunks, level=COMPRESS_LEVEL):
+    """Compress a stream of byte chunks into a single gzip stream."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+def _should_compress(response):
+    if 'gzip' not in request.accept_encodings or request.accept_encodings['gzip'] <= 0:
+        return False
+    if 'Content-Encoding' in response.headers or response.direct_passthrough:
+        return False
+    if response.status_code < 200 or response.status_code in (204, 304):
+        return False
+    return response.mimetype in COMPRESSIBLE_MIMETYPES
+
+def _is_cacheable(response):
+    return request.method == 'GET' and response.status_code == 200 \
+        and 'no-store' not in response.headers.get('Cache-Control', '')
+
+def setup_compression(app, min_size=COMPRESS_MIN_SIZE, level=COMPRESS_LEVEL, cache_size=COMPRESS_CACHE_SIZE):
+    """
+    Gzip responses for clients sending Accept-Encoding: gzip. Bodies smaller than
+    `min_size` bytes are left alone, streamed bodies are compressed chunk by chunk.
+    Compressed GET bodies are cached by content digest, so a repeated payload is
+    only compressed once.
+    """
+    compressed_bodies = LRUCache(cache_size)
+
+    @app.after_request
+    def compress_response(response):
+        response.vary.add('Accept-Encoding')
+        if not _should_compress(response):
+            return response
+
+        if response.is_streamed:
+            response.response = gzip_chunks(response.iter_encoded(), level)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < min_size:
+                return response
+            if _is_cacheable(response):
+                digest = hashlib.sha256(data).digest()
+                compressed = compressed_bodies.get_or_set(
+                    digest, lambda: gzip.compress(data, level, mtime=0))
+            else:
+                compressed = gzip.compress(data, level, mtime=0)
+            response.set_data(compressed)
+
+        response.headers['Content-Encoding'] = 'gzip'
+        return response
@@ -10,3 +10,39 @@ DATABASE_PATH = os.getenv('DATABASE_PATH')
 AUTH_DOMAIN = os.getenv('AUTH_DOMAIN')
 ALGORITHMS = os.getenv('ALGORITHMS')
 API_AUDIENCE = os.getenv('API_AUDIENCE')
+
+# Stats
+STATS_CACHE_TTL = int(os.getenv('STATS_CACHE_TTL', 30))
+
+# Change feed, seconds a change is held back so transactions committing out of seq order are not skipped
+CHANGES_SAFETY_WINDOW = float(os.getenv('CHANGES_SAFETY_WINDOW', 5))
+
+# Response compression
+COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', 500))
+COMPRESS_LEVEL = int(os.getenv('COMPRESS_LEVEL', 6))
+COMPRESS_CACHE_SIZE = int(os.getenv('COMPRESS_CACHE_SIZE', 256))
+
+# Admission control, limits are per worker process
+ADMISSION_READ_LIMIT = int(os.getenv('ADMISSION_READ_LIMIT', 16))
+ADMISSION_WRITE_LIMIT = int(os.getenv('ADMISSION_WRITE_LIMIT', 8))
+ADMISSION_ASSOCIATE_LIMIT = int(os.getenv('ADMISSION_ASSOCIATE_LIMIT', 4))
+ADMISSION_QUEUE_SIZE = int(os.getenv('ADMISSION_QUEUE_SIZE', 32))
+ADMISSION_TIMEOUT = float(os.getenv('ADMISSION_TIMEOUT', 1.0))
+ADMISSION_RETRY_AFTER = int(os.getenv('ADMISSION_RETRY_AFTER', 1))
+
+# Startup
+MIGRATE_ON_STARTUP = os.getenv('MIGRATE_ON_STARTUP', 'true').lower() == 'true'
+
+# Access log, disabled unless a path is set
+ACCESS_LOG_PATH = os.getenv('ACCESS_LOG_PATH')
+ACCESS_LOG_QUEUE_SIZE = int(os.getenv('ACCESS_LOG_QUEUE_SIZE', 10000))
+ACCESS_LOG_BATCH_SIZE = int(os.getenv('ACCESS_LOG_BATCH_SIZE', 256))
+ACCESS_LOG_MAX_BYTES = int(os.getenv('ACCESS_LOG_MAX_BYTES', 50 * 1024 * 1024))
+ACCESS_LOG_BACKUP_COUNT = int(os.getenv('ACCESS_LOG_BACKUP_COUNT', 5))
+
+# Catalog snapshot, disabled unless a path is set
+SNAPSHOT_PATH = os.getenv('SNAPSHOT_PATH')
+SNAPSHOT_CHECK_INTERVAL = float(os.getenv('SNAPSHOT_CHECK_INTERVAL', 1.0))
+SNAPSHOT_REBUILD_ON_WRITE = os.getenv('SNAPSHOT_REBUILD_ON_WRITE', 'true').lower() == 'true'
+SNAPSHOT_REBUILD_DELAY = float(os.getenv('SNAPSHOT_REBUILD_DELAY', 2.0))
+SNAPSHOT_REBUILD_INTERVAL = float(os.getenv('SNAPSHOT_REBUILD_INTERVAL', 0))
@@ -0,0 +1,38 @@
+"""
+Gunicorn settings. The app is built once in the master (preload) and forked into
+the workers, which share its imports, route table and mappers copy-on-write.
+The number of workers is taken from WEB_CONCURRENCY or --workers.
+"""
+import os
+
+bind = os.getenv('GUNICORN_BIND', ':8080')
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() == 'true'
+
+# Threaded workers, so admission control and request coalescing see concurrent requests.
+# More threads than ADMISSION_READ_LIMIT (16), the rest wait in the admission queue.
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 32))
+
+# Imported lazily by the app, load them in the master so workers don't each pay for them
+if preload_app:
+    import jose.jwt  # noqa: F401
+
+
+def when_ready(server):
+    # The master serves no requests, close whatever the startup migration left open
+    if not preload_app:
+        return
+    from app import app
+    from model import db
+    with app.app_context():
+        db.engine.dispose()
+
+
+def post_fork(server, worker):
+    # Never share pooled connections across processes, start each worker with a fresh pool
+    if not preload_app:
+        return
+    from app import app
+    from model import db
+    with app.app_context():
+        db.engine.dispose(close=False)
@@ -1,3 +1,4 @@
+DROP TABLE IF EXISTS changes CASCADE;
 DROP TABLE IF EXISTS movie_actors CASCADE;
 DROP TABLE IF EXISTS actors CASCADE;
 DROP TABLE IF EXISTS movies CASCADE;
@@ -5,24 +6,50 @@ DROP TABLE IF EXISTS movies CASCADE;
 CREATE TABLE movies (
     id SERIAL PRIMARY KEY,
     title VARCHAR(255) NOT NULL,
-    release_date TIMESTAMP NOT NULL
+    release_date TIMESTAMP NOT NULL,
+    cast_names JSON NOT NULL DEFAULT '[]',
+    cast_count INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP NOT NULL DEFAULT now(),
+    updated_at TIMESTAMP NOT NULL DEFAULT now()
 );
 
 CREATE TABLE actors (
     id SERIAL PRIMARY KEY,
     name VARCHAR(255) NOT NULL,
     age INTEGER NOT NULL,
-    gender VARCHAR(50) NOT NULL
+    gender VARCHAR(50) NOT NULL,
+    movie_titles JSON NOT NULL DEFAULT '[]',
+    movie_count INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMP NOT NULL DEFAULT now(),
+    updated_at TIMESTAMP NOT NULL DEFAULT now()
 );
 
 CREATE TABLE movie_actors (
     movie_id INTEGER,
     actor_id INTEGER,
+    created_at TIMESTAMP NOT NULL DEFAULT now(),
     PRIMARY KEY (movie_id, actor_id),
     FOREIGN KEY (movie_id) REFERENCES movies (id) ON DELETE CASCADE,
     FOREIGN KEY (actor_id) REFERENCES actors (id) ON DELETE CASCADE
 );
 
+CREATE INDEX ix_movies_title ON movies (title);
+CREATE INDEX ix_actors_name ON actors (name);
+CREATE INDEX ix_movie_actors_actor_id ON movie_actors (actor_id);
+CREATE INDEX ix_movies_updated_at ON movies (updated_at);
+CREATE INDEX ix_actors_updated_at ON actors (updated_at);
+CREATE INDEX ix_movie_actors_created_at ON movie_actors (created_at);
+
+CREATE TABLE changes (
+    seq SERIAL PRIMARY KEY,
+    table_name VARCHAR NOT NULL,
+    row_id INTEGER NOT NULL,
+    deleted BOOLEAN NOT NULL,
+    changed_at TIMESTAMP NOT NULL DEFAULT now()
+);
+
+CREATE UNIQUE INDEX ix_changes_table_name_row_id ON changes (table_name, row_id);
+
 INSERT INTO movies (title, release_date) VALUES
 ('Movie 1', '2022-01-01 00:00:00'),
 ('Movie 2', '2022-02-02 00:00:00');
@@ -35,4 +62,21 @@ INSERT INTO actors (name, age, gender) VALUES
 INSERT INTO movie_actors (movie_id, actor_id) VALUES
 (1, 1),
 (1, 2),
-(2, 3);
\ No newline at end of file
+(2, 3);
+
+UPDATE movies SET cast_names = s.names, cast_count = s.total
+FROM (SELECT ma.movie_id, json_agg(a.name) AS names, count(*) AS total
+      FROM movie_actors ma JOIN actors a ON a.id = ma.actor_id
+      GROUP BY ma.movie_id) s
+WHERE movies.id = s.movie_id;
+
+UPDATE actors SET movie_titles = s.titles, movie_count = s.total
+FROM (SELECT ma.actor_id, json_agg(m.title) AS titles, count(*) AS total
+      FROM movie_actors ma JOIN movies m ON m.id = ma.movie_id
+      GROUP BY ma.actor_id) s
+WHERE actors.id = s.actor_id;
+
+INSERT INTO changes (table_name, row_id, deleted)
+SELECT 'actors', id, false FROM actors
+UNION ALL
+SELECT 'movies', id, false FROM movies;
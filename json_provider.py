@@ -0,0 +1,48 @@
+import json
+from datetime import date
+
+from flask.json.provider import DefaultJSONProvider
+
+# orjson is an optional, C-accelerated encoder, the standard library is used without it
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def _default(obj):
+    """Serialize dates as ISO 8601 instead of Flask's RFC 822, defer everything else to Flask."""
+    if isinstance(obj, date):
+        return obj.isoformat()
+    return DefaultJSONProvider.default(obj)
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    JSON provider for API responses. Encodes with orjson when it is installed, writes
+    dates as ISO 8601, skips key sorting and always uses compact separators.
+    Responses are built from the encoded bytes directly.
+    """
+    default = staticmethod(_default)
+    ensure_ascii = False
+    sort_keys = False
+
+    def dumps(self, obj, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS).decode()
+        kwargs.setdefault('separators', (',', ':'))
+        return super().dumps(obj, **kwargs)
+
+    def dump_bytes(self, obj):
+        """Serialize data as UTF-8 encoded JSON."""
+        if orjson is not None:
+            return orjson.dumps(obj, default=self.default, option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(obj, default=self.default, ensure_ascii=self.ensure_ascii,
+                          sort_keys=self.sort_keys, separators=(',', ':')).encode()
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dump_bytes(obj), mimetype=self.mimetype)
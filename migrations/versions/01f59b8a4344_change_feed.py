@@ -0,0 +1,64 @@
+"""Change timestamps and change feed.
+
+Revision ID: 01f59b8a4344
+Revises: cbfb6e4c179f
+Create Date: 2026-10-19 11:26:53.017442
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '01f59b8a4344'
+down_revision = 'cbfb6e4c179f'
+branch_labels = None
+depends_on = None
+
+
+def _batch_alter_table(table_name):
+    # SQLite can only add columns with a constant default in place
+    recreate = 'always' if op.get_bind().dialect.name == 'sqlite' else 'auto'
+    return op.batch_alter_table(table_name, recreate=recreate)
+
+
+def upgrade():
+    for table_name in ('actors', 'movies'):
+        with _batch_alter_table(table_name) as batch_op:
+            batch_op.add_column(sa.Column('created_at', sa.DateTime(), nullable=False, server_default=sa.func.now()))
+            batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=False, server_default=sa.func.now()))
+            batch_op.create_index(batch_op.f(f'ix_{table_name}_updated_at'), ['updated_at'], unique=False)
+    with _batch_alter_table('movie_actors') as batch_op:
+        batch_op.add_column(sa.Column('created_at', sa.DateTime(), nullable=False, server_default=sa.func.now()))
+        batch_op.create_index(batch_op.f('ix_movie_actors_created_at'), ['created_at'], unique=False)
+
+    changes = op.create_table('changes',
+    sa.Column('seq', sa.Integer(), nullable=False),
+    sa.Column('table_name', sa.String(), nullable=False),
+    sa.Column('row_id', sa.Integer(), nullable=False),
+    sa.Column('deleted', sa.Boolean(), nullable=False),
+    sa.Column('changed_at', sa.DateTime(), server_default=sa.func.now(), nullable=False),
+    sa.PrimaryKeyConstraint('seq'),
+    sqlite_autoincrement=True
+    )
+    op.create_index('ix_changes_table_name_row_id', 'changes', ['table_name', 'row_id'], unique=True)
+
+    # Start the feed with the current catalog, so readers can bootstrap from since=0
+    for table_name in ('actors', 'movies'):
+        op.execute(changes.insert().from_select(
+            ['table_name', 'row_id', 'deleted'],
+            sa.select(sa.literal(table_name), sa.table(table_name, sa.column('id')).c.id, sa.false())
+        ))
+
+
+def downgrade():
+    op.drop_index('ix_changes_table_name_row_id', table_name='changes')
+    op.drop_table('changes')
+    with _batch_alter_table('movie_actors') as batch_op:
+        batch_op.drop_index(batch_op.f('ix_movie_actors_created_at'))
+        batch_op.drop_column('created_at')
+    for table_name in ('movies', 'actors'):
+        with _batch_alter_table(table_name) as batch_op:
+            batch_op.drop_index(batch_op.f(f'ix_{table_name}_updated_at'))
+            batch_op.drop_column('updated_at')
+            batch_op.drop_column('created_at')
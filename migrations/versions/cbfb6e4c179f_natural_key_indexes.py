@@ -0,0 +1,28 @@
+"""Index natural keys and the actor side of movie_actors.
+
+Revision ID: cbfb6e4c179f
+Revises: ccd6b702e8a5
+Create Date: 2026-10-19 10:04:17.928114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'cbfb6e4c179f'
+down_revision = 'ccd6b702e8a5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(op.f('ix_actors_name'), 'actors', ['name'], unique=False)
+    op.create_index(op.f('ix_movies_title'), 'movies', ['title'], unique=False)
+    op.create_index(op.f('ix_movie_actors_actor_id'), 'movie_actors', ['actor_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_movie_actors_actor_id'), table_name='movie_actors')
+    op.drop_index(op.f('ix_movies_title'), table_name='movies')
+    op.drop_index(op.f('ix_actors_name'), table_name='actors')
@@ -0,0 +1,60 @@
+"""Denormalized cast and filmography summaries.
+
+Revision ID: ccd6b702e8a5
+Revises: b5c520b0b97f
+Create Date: 2026-10-19 09:12:41.503317
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'ccd6b702e8a5'
+down_revision = 'b5c520b0b97f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('movies', sa.Column('cast_names', sa.JSON(), nullable=False, server_default='[]'))
+    op.add_column('movies', sa.Column('cast_count', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('actors', sa.Column('movie_titles', sa.JSON(), nullable=False, server_default='[]'))
+    op.add_column('actors', sa.Column('movie_count', sa.Integer(), nullable=False, server_default='0'))
+
+    # Backfill the summaries of existing rows
+    movies = sa.table('movies',
+        sa.column('id', sa.Integer), sa.column('title', sa.String),
+        sa.column('cast_names', sa.JSON), sa.column('cast_count', sa.Integer))
+    actors = sa.table('actors',
+        sa.column('id', sa.Integer), sa.column('name', sa.String),
+        sa.column('movie_titles', sa.JSON), sa.column('movie_count', sa.Integer))
+    movie_actors = sa.table('movie_actors',
+        sa.column('movie_id', sa.Integer), sa.column('actor_id', sa.Integer))
+
+    bind = op.get_bind()
+    cast_names = {}
+    movie_titles = {}
+    rows = bind.execute(
+        sa.select(movie_actors.c.movie_id, movie_actors.c.actor_id, movies.c.title, actors.c.name)
+        .join(movies, movies.c.id == movie_actors.c.movie_id)
+        .join(actors, actors.c.id == movie_actors.c.actor_id))
+    for movie_id, actor_id, title, name in rows:
+        cast_names.setdefault(movie_id, []).append(name)
+        movie_titles.setdefault(actor_id, []).append(title)
+
+    for movie_id, names in cast_names.items():
+        bind.execute(movies.update().where(movies.c.id == movie_id)
+                     .values(cast_names=names, cast_count=len(names)))
+    for actor_id, titles in movie_titles.items():
+        bind.execute(actors.update().where(actors.c.id == actor_id)
+                     .values(movie_titles=titles, movie_count=len(titles)))
+
+
+def downgrade():
+    with op.batch_alter_table('actors') as batch_op:
+        batch_op.drop_column('movie_count')
+        batch_op.drop_column('movie_titles')
+    with op.batch_alter_table('movies') as batch_op:
+        batch_op.drop_column('cast_count')
+        batch_op.drop_column('cast_names')
@@ -1,5 +1,9 @@
+from datetime import timedelta
+
 from flask_sqlalchemy import SQLAlchemy
-from config import DATABASE_PATH
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import configure_mappers
+from config import CHANGES_SAFETY_WINDOW, DATABASE_PATH
 
 db = SQLAlchemy()
 
@@ -9,29 +13,81 @@ def setup_db(app):
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
     db.app = app
     db.init_app(app)
+    # Configure mappers up front instead of on the first query, so forked workers inherit them
+    configure_mappers()
 
 class Movies(db.Model):
     """Movies Model"""
     id = db.Column(db.Integer, primary_key=True)
-    title = db.Column(db.String, nullable=False)
+    title = db.Column(db.String, nullable=False, index=True)
     release_date = db.Column(db.DateTime, nullable=False)
+    # Denormalized cast summary, maintained on write so format() stays a single-row read
+    cast_names = db.Column(db.JSON, nullable=False, default=list)
+    cast_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, nullable=False, server_default=db.func.now())
+    updated_at = db.Column(db.DateTime, nullable=False, server_default=db.func.now(),
+                           onupdate=db.func.now(), index=True)
     actors = db.relationship('Actors', secondary='movie_actors', back_populates='movies', lazy=True)
 
     # Functions for extra Layer of abstraction. More scalable
     def __init__(self, title, release_date):
         self.title = title
         self.release_date = release_date
+        self.cast_names = []
+        self.cast_count = 0
     
     def insert(self):
         db.session.add(self)
+        db.session.flush()
+        Changes.record('movies', [self.id])
         db.session.commit()
 
     def update(self):
+        # Check before anything autoflushes, a flush clears the attribute history
+        renamed = db.inspect(self).attrs.title.history.has_changes()
+        Changes.record('movies', [self.id])
+        if renamed:
+            actor_ids = [actor.id for actor in self.actors]
+            lock_rows(Actors, actor_ids)
+            db.session.flush()
+            Actors.refresh_movie_summaries(actor_ids)
+            Changes.record('actors', actor_ids)
         db.session.commit()
 
     def delete(self):
+        actor_ids = [actor.id for actor in self.actors]
+        lock_rows(Movies, [self.id])
+        lock_rows(Actors, actor_ids)
         db.session.delete(self)
+        db.session.flush()
+        Actors.refresh_movie_summaries(actor_ids)
+        Changes.record('actors', actor_ids)
+        Changes.record('movies', [self.id], deleted=True)
         db.session.commit()
+
+    def refresh_cast_summaries(movie_ids=None):
+        """
+        Recompute cast_names and cast_count from the movie_actors join in a single UPDATE,
+        for the given movies or every movie. Reading the join in SQL, after the rows are
+        locked, keeps concurrent writes to the same movie from overwriting each other.
+        """
+        if movie_ids is not None and not movie_ids:
+            return
+        cast_names = db.select(db.func.coalesce(_json_agg(Actors.name), '[]')) \
+            .select_from(movie_actors) \
+            .join(Actors, Actors.id == movie_actors.c.actor_id) \
+            .where(movie_actors.c.movie_id == Movies.id)
+        cast_count = db.select(db.func.count(movie_actors.c.actor_id)) \
+            .where(movie_actors.c.movie_id == Movies.id)
+        # Summaries are derived data, keep updated_at so exports --since don't see rows as changed
+        update = db.update(Movies).values(
+            cast_names=cast_names.scalar_subquery(),
+            cast_count=cast_count.scalar_subquery(),
+            updated_at=Movies.updated_at
+        )
+        if movie_ids is not None:
+            update = update.where(Movies.id.in_(movie_ids))
+        db.session.execute(update)
     
     def get_movie(movie_id: int):
         return db.session.get(Movies, movie_id)
@@ -39,20 +95,53 @@ class Movies(db.Model):
     def get_all_movies():
         return db.session.query(Movies).all()
 
+    def count_movies(estimate=False):
+        return count_rows(Movies, estimate)
+
+    def get_movies(movie_ids):
+        return db.session.query(Movies).filter(Movies.id.in_(movie_ids)).all()
+
+    def get_cast_sizes():
+        """Number of actors associated with each movie."""
+        cast_size = db.func.count(movie_actors.c.actor_id)
+        rows = db.session.query(Movies.id, Movies.title, cast_size) \
+            .outerjoin(movie_actors, movie_actors.c.movie_id == Movies.id) \
+            .group_by(Movies.id, Movies.title) \
+            .order_by(cast_size.desc(), Movies.id) \
+            .all()
+        return [{'movie_id': id, 'title': title, 'cast_size': size}
+                for id, title, size in rows]
+
+    def get_releases_per_year():
+        """Number of movies released in each year."""
+        year = db.extract('year', Movies.release_date)
+        rows = db.session.query(year, db.func.count(Movies.id)) \
+            .group_by(year) \
+            .order_by(year) \
+            .all()
+        return [{'year': int(year), 'movies': count} for year, count in rows]
+
     def format(self):
         return {
             'id': self.id,
             'title': self.title,
             'release_date': self.release_date,
-            'actors': [actor.name for actor in self.actors]
+            'actors': list(self.cast_names),
+            'cast_count': self.cast_count
         }
     
 class Actors(db.Model):
     """Actors Model"""
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String, nullable=False)
+    name = db.Column(db.String, nullable=False, index=True)
     age = db.Column(db.Integer, nullable=False)
     gender = db.Column(db.String, nullable=False)
+    # Denormalized filmography summary, maintained on write so format() stays a single-row read
+    movie_titles = db.Column(db.JSON, nullable=False, default=list)
+    movie_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, nullable=False, server_default=db.func.now())
+    updated_at = db.Column(db.DateTime, nullable=False, server_default=db.func.now(),
+                           onupdate=db.func.now(), index=True)
     movies = db.relationship('Movies', secondary='movie_actors', back_populates='actors', lazy=True)
 
     # Functions for extra Layer of abstraction. More scalable
@@ -60,26 +149,109 @@ class Actors(db.Model):
         self.name = name
         self.age = age
         self.gender = gender
+        self.movie_titles = []
+        self.movie_count = 0
     
     def insert(self):
         db.session.add(self)
+        db.session.flush()
+        Changes.record('actors', [self.id])
         db.session.commit()
 
     def update(self):
+        # Check before anything autoflushes, a flush clears the attribute history
+        renamed = db.inspect(self).attrs.name.history.has_changes()
+        if renamed:
+            # Lock the movies before the flush locks this actor, movies come first for every writer
+            with db.session.no_autoflush:
+                movie_ids = [movie.id for movie in self.movies]
+                lock_rows(Movies, movie_ids)
+        Changes.record('actors', [self.id])
+        if renamed:
+            db.session.flush()
+            Movies.refresh_cast_summaries(movie_ids)
+            Changes.record('movies', movie_ids)
         db.session.commit()
 
     def delete(self):
+        movie_ids = [movie.id for movie in self.movies]
+        lock_rows(Movies, movie_ids)
         db.session.delete(self)
+        db.session.flush()
+        Movies.refresh_cast_summaries(movie_ids)
+        Changes.record('movies', movie_ids)
+        Changes.record('actors', [self.id], deleted=True)
         db.session.commit()
+
+    def refresh_movie_summaries(actor_ids=None):
+        """Recompute movie_titles and movie_count like Movies.refresh_cast_summaries."""
+        if actor_ids is not None and not actor_ids:
+            return
+        movie_titles = db.select(db.func.coalesce(_json_agg(Movies.title), '[]')) \
+            .select_from(movie_actors) \
+            .join(Movies, Movies.id == movie_actors.c.movie_id) \
+            .where(movie_actors.c.actor_id == Actors.id)
+        movie_count = db.select(db.func.count(movie_actors.c.movie_id)) \
+            .where(movie_actors.c.actor_id == Actors.id)
+        update = db.update(Actors).values(
+            movie_titles=movie_titles.scalar_subquery(),
+            movie_count=movie_count.scalar_subquery(),
+            updated_at=Actors.updated_at
+        )
+        if actor_ids is not None:
+            update = update.where(Actors.id.in_(actor_ids))
+        db.session.execute(update)
     
     def get_actor(actor_id: int):
         return db.session.get(Actors, actor_id)
     
     def get_all_actors():
         return db.session.query(Actors).all()
+
+    def count_actors(estimate=False):
+        return count_rows(Actors, estimate)
+
+    def get_actors(actor_ids):
+        return db.session.query(Actors).filter(Actors.id.in_(actor_ids)).all()
+
+    def get_movie_counts():
+        """Number of movies each actor is associated with."""
+        movie_count = db.func.count(movie_actors.c.movie_id)
+        rows = db.session.query(Actors.id, Actors.name, movie_count) \
+            .outerjoin(movie_actors, movie_actors.c.actor_id == Actors.id) \
+            .group_by(Actors.id, Actors.name) \
+            .order_by(movie_count.desc(), Actors.id) \
+            .all()
+        return [{'actor_id': id, 'name': name, 'movies': count}
+                for id, name, count in rows]
+
+    def get_age_distribution(bucket_size=10):
+        """Actor counts per gender and age bucket, e.g. 20-29."""
+        bucket = (Actors.age // bucket_size) * bucket_size
+        rows = db.session.query(Actors.gender, bucket, db.func.count(Actors.id)) \
+            .group_by(Actors.gender, bucket) \
+            .order_by(Actors.gender, bucket) \
+            .all()
+        distribution = {}
+        for gender, start, count in rows:
+            distribution.setdefault(gender, []).append({
+                'min_age': start,
+                'max_age': start + bucket_size - 1,
+                'actors': count
+            })
+        return distribution
     
     def create_association(self, movie):
+        """Associate a movie and update both summaries in the same transaction."""
+        # Movies before actors, the same order as every other writer, so locks can't deadlock
+        lock_rows(Movies, [movie.id])
+        lock_rows(Actors, [self.id])
         self.movies.append(movie)
+        db.session.flush()
+        Movies.refresh_cast_summaries([movie.id])
+        Actors.refresh_movie_summaries([self.id])
+        Changes.record('actors', [self.id])
+        Changes.record('movies', [movie.id])
         db.session.commit()
 
     def format(self):
@@ -88,11 +260,154 @@ class Actors(db.Model):
             'name': self.name,
             'age': self.age,
             'gender': self.gender,
-            'movies': [movie.title for movie in self.movies]
+            'movies': list(self.movie_titles),
+            'movie_count': self.movie_count
+        }
+
+class Changes(db.Model):
+    """
+    Change feed Model. Holds the latest change of every actor and movie, deletions
+    included as tombstones, ordered by an ever increasing seq.
+    """
+    seq = db.Column(db.Integer, primary_key=True)
+    table_name = db.Column(db.String, nullable=False)
+    row_id = db.Column(db.Integer, nullable=False)
+    deleted = db.Column(db.Boolean, nullable=False, default=False)
+    changed_at = db.Column(db.DateTime, nullable=False, server_default=db.func.now())
+
+    __table_args__ = (
+        db.Index('ix_changes_table_name_row_id', 'table_name', 'row_id', unique=True),
+        # never reuse the seq of a replaced entry, readers may already be past it
+        {'sqlite_autoincrement': True}
+    )
+
+    def record(table_name, row_ids, deleted=False):
+        """
+        Move the given rows to the head of the feed. `row_ids` is a list of ids or
+        a single column select, so bulk writes can be recorded without loading them.
+        """
+        if isinstance(row_ids, list):
+            if not row_ids:
+                return
+            # Remembered so a request can find the seqs its own writes got, see get_recorded_seq
+            db.session.info.setdefault('recorded_changes', []).append((table_name, row_ids))
+            rows = [{'table_name': table_name, 'row_id': id, 'deleted': deleted}
+                    for id in dict.fromkeys(row_ids)]
+        else:
+            ids = row_ids.subquery()
+            rows = db.select(db.literal(table_name), ids.c[0], db.literal(deleted))
+
+        if db.engine.dialect.name == 'postgresql':
+            # An upsert locks the entry until commit, so concurrent writes to one row
+            # queue up instead of both inserting and failing on the unique index
+            insert = postgresql.insert(Changes)
+            insert = insert.values(rows) if isinstance(rows, list) \
+                else insert.from_select(['table_name', 'row_id', 'deleted'], rows)
+            db.session.execute(insert.on_conflict_do_update(
+                index_elements=['table_name', 'row_id'],
+                set_={
+                    'seq': db.func.nextval(db.func.pg_get_serial_sequence('changes', 'seq')),
+                    'deleted': insert.excluded.deleted,
+                    'changed_at': db.func.now()
+                }
+            ))
+            return
+
+        # Other databases serialize writers, replacing the entries is safe there
+        db.session.execute(db.delete(Changes).where(
+            Changes.table_name == table_name,
+            Changes.row_id.in_(row_ids)
+        ))
+        if isinstance(rows, list):
+            db.session.execute(db.insert(Changes), rows)
+        else:
+            db.session.execute(db.insert(Changes).from_select(['table_name', 'row_id', 'deleted'], rows))
+
+    def get_latest_seq():
+        return db.session.scalar(db.select(db.func.max(Changes.seq))) or 0
+
+    def get_recorded_seq():
+        """Highest seq of the changes recorded by this session's list writes, 0 if none."""
+        recorded = db.session.info.pop('recorded_changes', [])
+        if not recorded:
+            return 0
+        return db.session.scalar(db.select(db.func.max(Changes.seq)).where(db.or_(*[
+            db.and_(Changes.table_name == table_name, Changes.row_id.in_(row_ids))
+            for table_name, row_ids in recorded
+        ]))) or 0
+
+    def _settled(query, safety_window):
+        if not safety_window:
+            return query
+        now = db.session.scalar(db.select(db.func.now()))
+        return query.filter(Changes.changed_at <= now - timedelta(seconds=safety_window))
+
+    def get_settled_seq(safety_window=CHANGES_SAFETY_WINDOW):
+        """
+        Highest seq recorded more than `safety_window` seconds ago. Changes up to it are
+        taken to be committed, the same assumption get_changes makes.
+        """
+        query = Changes._settled(db.session.query(db.func.max(Changes.seq)), safety_window)
+        return query.scalar() or 0
+
+    def get_changes(since=0, limit=100, safety_window=CHANGES_SAFETY_WINDOW):
+        """
+        Changes after `since`, oldest first. A seq is taken when a change is recorded but
+        transactions can commit out of order, so entries younger than `safety_window`
+        seconds are held back until slower transactions with lower seqs are visible.
+        """
+        query = Changes._settled(db.session.query(Changes).filter(Changes.seq > since), safety_window)
+        return query.order_by(Changes.seq).limit(limit).all()
+
+    def format(self):
+        return {
+            'seq': self.seq,
+            'table': self.table_name,
+            'id': self.row_id,
+            'deleted': self.deleted,
+            'changed_at': self.changed_at
         }
 
 # Define the secondary table
 movie_actors = db.Table('movie_actors',
     db.Column('movie_id', db.Integer, db.ForeignKey('movies.id'), primary_key=True),
-    db.Column('actor_id', db.Integer, db.ForeignKey('actors.id'), primary_key=True)
-)
\ No newline at end of file
+    db.Column('actor_id', db.Integer, db.ForeignKey('actors.id'), primary_key=True, index=True),
+    db.Column('created_at', db.DateTime, nullable=False, server_default=db.func.now(), index=True)
+)
+
+def count_rows(model, estimate=False):
+    """
+    Number of rows in a model's table, without transferring them. With `estimate`,
+    PostgreSQL's planner statistics are read instead of running COUNT(*); they are
+    only as fresh as the last ANALYZE. Other databases always count.
+    """
+    if estimate and db.engine.dialect.name == 'postgresql':
+        estimated = db.session.execute(
+            db.text('SELECT reltuples::bigint FROM pg_class WHERE oid = CAST(:table AS regclass)'),
+            {'table': model.__tablename__}
+        ).scalar()
+        # reltuples is -1 until the table is first analyzed
+        if estimated is not None and estimated >= 0:
+            return estimated
+    return db.session.query(db.func.count(model.id)).scalar()
+
+def _json_agg(column):
+    """Aggregate a column into a JSON array in the dialect of the bound database."""
+    if db.engine.dialect.name == 'postgresql':
+        return db.func.json_agg(column)
+    return db.func.json_group_array(column)
+
+def lock_rows(model, ids):
+    """
+    Lock rows for the rest of the transaction with SELECT ... FOR UPDATE, in id order.
+    SQLite has no row locks, it serializes writers on the whole database instead.
+    """
+    if ids:
+        db.session.execute(db.select(model.id).where(model.id.in_(ids))
+                           .order_by(model.id).with_for_update())
+
+def rebuild_summaries():
+    """Recompute every denormalized cast and filmography summary from movie_actors."""
+    Movies.refresh_cast_summaries()
+    Actors.refresh_movie_summaries()
+    db.session.commit()
@@ -0,0 +1,67 @@
+import threading
+from functools import wraps
+
+from flask import Response, make_response, request
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """
+    De-duplicates concurrent calls: while a call for a key is in flight, callers
+    with the same key wait for it and share its result instead of running their own.
+    """
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def coalesce(self, f):
+        """
+        Decorate a read route placed under requires_auth. Identical concurrent requests,
+        same method, route, arguments and permissions, share the leader's response body.
+        """
+        @wraps(f)
+        def wrapper(payload, *args, **kwargs):
+            scope = tuple(sorted(payload.get('permissions', []))) if payload else None
+            key = (
+                request.method,
+                request.endpoint,
+                tuple(sorted(kwargs.items())),
+                tuple(sorted(request.args.items(multi=True))),
+                scope
+            )
+
+            def respond():
+                response = make_response(f(payload, *args, **kwargs))
+                return response.get_data(), response.status_code, list(response.headers)
+
+            data, status, headers = self.do(key, respond)
+            return Response(data, status, headers)
+        return wrapper
@@ -0,0 +1,327 @@
+"""
+Read-only catalog snapshot shared by all workers through mmap.
+
+The file holds actors, movies and movie_actors in columnar form: sorted fixed-width
+id arrays, offset-indexed string tables and sorted adjacency lists (CSR) in both
+directions. Readers map it without copying and answer get/list reads from it.
+A new snapshot is written next to the old one and swapped in with os.replace.
+
+Layout, little-endian, every section 8 byte aligned:
+    header      magic, changes seq, build time, section count
+    sections    (offset, length) per section, in SECTIONS order
+"""
+import bisect
+import fcntl
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+from datetime import datetime, timedelta
+
+from flask import request
+
+from bulk import export_rows
+from config import (CHANGES_SAFETY_WINDOW, SNAPSHOT_CHECK_INTERVAL, SNAPSHOT_PATH, SNAPSHOT_REBUILD_DELAY,
+                    SNAPSHOT_REBUILD_INTERVAL, SNAPSHOT_REBUILD_ON_WRITE)
+from model import Changes
+
+MAGIC = b'CATSNAP1'
+HEADER = struct.Struct('<8sqqI')
+SECTION = struct.Struct('<QQ')
+EPOCH = datetime(1970, 1, 1)
+
+# Section name and array typecode, None for raw UTF-8 blobs
+SECTIONS = (
+    ('actor_ids', 'q'),
+    ('actor_ages', 'q'),
+    ('actor_name_offsets', 'Q'),
+    ('actor_names', None),
+    ('actor_gender_offsets', 'Q'),
+    ('actor_genders', None),
+    ('movie_ids', 'q'),
+    ('movie_release_dates', 'q'),
+    ('movie_title_offsets', 'Q'),
+    ('movie_titles', None),
+    ('actor_movie_offsets', 'Q'),
+    ('actor_movies', 'Q'),
+    ('movie_actor_offsets', 'Q'),
+    ('movie_actors', 'Q')
+)
+
+def _string_table(strings):
+    """Encode strings into an offsets array (one entry more than strings) and a blob."""
+    offsets = array('Q', [0])
+    blob = bytearray()
+    for string in strings:
+        blob += string.encode()
+        offsets.append(len(blob))
+    return offsets, bytes(blob)
+
+def _adjacency(pairs, count):
+    """Build CSR offsets and indices from (source, target) index pairs sorted by source."""
+    offsets = array('Q', [0] * (count + 1))
+    indices = array('Q')
+    for source, target in pairs:
+        offsets[source + 1] += 1
+        indices.append(target)
+    for i in range(count):
+        offsets[i + 1] += offsets[i]
+    return offsets, indices
+
+def write_snapshot(path, actors, movies, links, seq=0):
+    """
+    Write a snapshot of (id, name, age, gender) actors, (id, title, release_date) movies
+    and (movie_id, actor_id) links, each sorted by id, and atomically replace `path`.
+    """
+    actors = list(actors)
+    movies = list(movies)
+    actor_index = {row[0]: i for i, row in enumerate(actors)}
+    movie_index = {row[0]: i for i, row in enumerate(movies)}
+    pairs = sorted((movie_index[movie_id], actor_index[actor_id]) for movie_id, actor_id in links)
+
+    name_offsets, names = _string_table(row[1] for row in actors)
+    gender_offsets, genders = _string_table(row[3] for row in actors)
+    title_offsets, titles = _string_table(row[1] for row in movies)
+    movie_actor_offsets, movie_actor_indices = _adjacency(pairs, len(movies))
+    actor_movie_offsets, actor_movie_indices = _adjacency(
+        sorted((actor, movie) for movie, actor in pairs), len(actors))
+    sections = (
+        array('q', (row[0] for row in actors)),
+        array('q', (row[2] for row in actors)),
+        name_offsets, names,
+        gender_offsets, genders,
+        array('q', (row[0] for row in movies)),
+        array('q', ((row[2] - EPOCH) // timedelta(microseconds=1) for row in movies)),
+        title_offsets, titles,
+        actor_movie_offsets, actor_movie_indices,
+        movie_actor_offsets, movie_actor_indices
+    )
+
+    data_start = HEADER.size + SECTION.size * len(sections)
+    offset = data_start
+    table = []
+    payloads = []
+    for section in sections:
+        payload = section.tobytes() if isinstance(section, array) else section
+        offset += -offset % 8
+        table.append((offset, len(payload)))
+        payloads.append((offset, payload))
+        offset += len(payload)
+
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, seq, int(time.time()), len(sections)))
+        for entry in table:
+            f.write(SECTION.pack(*entry))
+        for offset, payload in payloads:
+            f.write(b'\0' * (offset - f.tell()))
+            f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def snapshot_seq(path):
+    """The change feed seq the snapshot at `path` was built at, None if there is none."""
+    try:
+        with open(path, 'rb') as f:
+            magic, seq, _, _ = HEADER.unpack(f.read(HEADER.size))
+    except (FileNotFoundError, struct.error):
+        return None
+    return seq if magic == MAGIC else None
+
+def build_snapshot(path):
+    """Write a snapshot of the database, read through server-side cursors."""
+    # Label the snapshot with the settled feed position, read first. Younger seqs may belong
+    # to transactions that commit after the rows are read, so they can't be vouched for.
+    seq = Changes.get_settled_seq()
+    rows = {kind: [row for batch in export_rows(kind) for row in batch]
+            for kind in ('actors', 'movies', 'movie_actors')}
+    write_snapshot(path, rows['actors'], rows['movies'], rows['movie_actors'], seq)
+
+class Snapshot:
+    """A memory-mapped snapshot. Arrays are zero-copy views into the mapping."""
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        magic, self.seq, self.built_at, count = HEADER.unpack_from(view)
+        if magic != MAGIC or count != len(SECTIONS):
+            raise ValueError(f'{path} is not a catalog snapshot')
+        for i, (name, typecode) in enumerate(SECTIONS):
+            offset, length = SECTION.unpack_from(view, HEADER.size + i * SECTION.size)
+            section = view[offset:offset + length]
+            setattr(self, name, section.cast(typecode) if typecode else section)
+
+    def _string(self, offsets, blob, i):
+        return str(blob[offsets[i]:offsets[i + 1]], 'utf-8')
+
+    def _find(self, ids, id):
+        i = bisect.bisect_left(ids, id)
+        return i if i < len(ids) and ids[i] == id else None
+
+    def _format_actor(self, i):
+        start, end = self.actor_movie_offsets[i], self.actor_movie_offsets[i + 1]
+        titles = [self._string(self.movie_title_offsets, self.movie_titles, movie)
+                  for movie in self.actor_movies[start:end]]
+        return {
+            'id': self.actor_ids[i],
+            'name': self._string(self.actor_name_offsets, self.actor_names, i),
+            'age': self.actor_ages[i],
+            'gender': self._string(self.actor_gender_offsets, self.actor_genders, i),
+            'movies': titles,
+            'movie_count': len(titles)
+        }
+
+    def _format_movie(self, i):
+        start, end = self.movie_actor_offsets[i], self.movie_actor_offsets[i + 1]
+        names = [self._string(self.actor_name_offsets, self.actor_names, actor)
+                 for actor in self.movie_actors[start:end]]
+        return {
+            'id': self.movie_ids[i],
+            'title': self._string(self.movie_title_offsets, self.movie_titles, i),
+            'release_date': EPOCH + timedelta(microseconds=self.movie_release_dates[i]),
+            'actors': names,
+            'cast_count': len(names)
+        }
+
+    def get_actor(self, actor_id):
+        """The formatted actor, or None if it is not in the snapshot."""
+        i = self._find(self.actor_ids, actor_id)
+        return None if i is None else self._format_actor(i)
+
+    def get_movie(self, movie_id):
+        """The formatted movie, or None if it is not in the snapshot."""
+        i = self._find(self.movie_ids, movie_id)
+        return None if i is None else self._format_movie(i)
+
+    def get_all_actors(self):
+        return [self._format_actor(i) for i in range(len(self.actor_ids))]
+
+    def get_all_movies(self):
+        return [self._format_movie(i) for i in range(len(self.movie_ids))]
+
+class SnapshotStore:
+    """
+    Serves the snapshot at `path`, swapping in a new file when it is replaced. Checks
+    for a new file at most every `check_interval` seconds. A snapshot older than the
+    last write of this process is not served, so a worker always reads its own writes.
+    """
+    def __init__(self, path, check_interval=1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self.min_seq = 0
+        self._snapshot = None
+        self._stat = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def current(self):
+        """The snapshot to serve reads from, None to read from the database."""
+        now = time.monotonic()
+        if self._checked_at is None or now - self._checked_at >= self.check_interval:
+            with self._lock:
+                self._checked_at = now
+                self._reload()
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.seq < self.min_seq:
+            return None
+        return snapshot
+
+    def written(self, seq):
+        """Record a write of this process, reads fall back to the database until a newer snapshot."""
+        self.min_seq = max(self.min_seq, seq)
+
+    def _reload(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self._snapshot = self._stat = None
+            return
+        key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if key != self._stat:
+            # The replaced mapping is unmapped once the last reader drops it
+            self._snapshot = Snapshot(self.path)
+            self._stat = key
+
+class SnapshotRebuilder:
+    """
+    Rebuilds the snapshot in a background thread, `delay` seconds after a write is
+    signalled and every `interval` seconds if set. A lock file makes sure only one
+    process builds at a time; a process that finds it taken tries again later, and
+    skips the build if the snapshot written meanwhile already covers the settled feed.
+    """
+    def __init__(self, app, path, delay, interval=0):
+        self.app = app
+        self.path = path
+        self.delay = delay
+        self.interval = interval
+        self._requested = threading.Event()
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def request(self):
+        self.start()
+        self._requested.set()
+
+    def start(self):
+        # Threads don't survive a fork, start the rebuilder on first use in every process
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._requested = threading.Event()
+            threading.Thread(target=self._run, name='snapshot-rebuilder', daemon=True).start()
+            self._pid = os.getpid()
+
+    def _run(self):
+        while True:
+            requested = self._requested.wait(self.interval or None)
+            if requested:
+                time.sleep(self.delay)
+            self._requested.clear()
+            if not self._build():
+                self._requested.set()
+
+    def _build(self):
+        """Build the snapshot unless another process is, return False if it was skipped."""
+        with open(f'{self.path}.lock', 'w') as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            try:
+                with self.app.app_context():
+                    built_seq = snapshot_seq(self.path)
+                    if built_seq is None or built_seq < Changes.get_settled_seq():
+                        build_snapshot(self.path)
+            except Exception:
+                self.app.logger.exception('Rebuilding the catalog snapshot failed')
+            return True
+
+def setup_snapshots(app, path=SNAPSHOT_PATH):
+    """
+    Serve actor and movie reads from the snapshot at `path`, if set, and rebuild it
+    after writes. Returns the SnapshotStore.
+    """
+    if not path:
+        return None
+
+    store = SnapshotStore(path, SNAPSHOT_CHECK_INTERVAL)
+    # A write only settles into a snapshot's seq after the change feed's safety window
+    delay = max(SNAPSHOT_REBUILD_DELAY, CHANGES_SAFETY_WINDOW)
+    rebuilder = SnapshotRebuilder(app, path, delay, SNAPSHOT_REBUILD_INTERVAL)
+    if SNAPSHOT_REBUILD_INTERVAL:
+        app.before_request(rebuilder.start)
+
+    @app.after_request
+    def rebuild_after_write(response):
+        if request.method in ('POST', 'PATCH', 'DELETE') and response.status_code < 400:
+            store.written(Changes.get_recorded_seq())
+            if SNAPSHOT_REBUILD_ON_WRITE:
+                rebuilder.request()
+        return response
+
+    return store
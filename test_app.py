@@ -1,9 +1,20 @@
 import unittest
 from unittest.mock import patch, MagicMock
+import fcntl
+import gzip
 import json
-
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from access_log import AccessLog, setup_access_log
+from admission import ConcurrencyLimiter
 from app import create_app
-from model import Movies, Actors
+from bulk import batched, export_rows, import_files, read_records
+from model import Changes, Movies, Actors, db, movie_actors, rebuild_summaries
+from snapshot import Snapshot, SnapshotRebuilder, SnapshotStore, write_snapshot
 
 class CreateAppTestCase(unittest.TestCase):
     """This class represents the create_app test case"""
@@ -44,6 +55,15 @@ class CreateAppTestCase(unittest.TestCase):
         self.assertEqual(data["success"], True)
         self.assertTrue(data["actors"])
     
+    @patch('model.Actors.count_actors', MagicMock(return_value=42))
+    def test_head_actors(self):
+        """Test HEAD actors route returns only the total count"""
+        res = self.client.head("/actors")
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.headers["X-Total-Count"], "42")
+        self.assertEqual(res.data, b"")
+
     @patch('model.Actors.get_actor', MagicMock(return_value=Actors(name="John Doe", age=27, gender="male")))
     def test_get_actor(self):
         """Test get actor by id route"""
@@ -78,6 +98,16 @@ class CreateAppTestCase(unittest.TestCase):
         self.assertEqual(res.status_code, 200)
         self.assertEqual(data["success"], True)
         self.assertTrue(data["movies"])
+        self.assertEqual(res.headers["X-Total-Count"], "2")
+
+    def test_head_movies_estimate(self):
+        """Test HEAD movies route passes the estimate flag to the count"""
+        with patch('model.Movies.count_movies', MagicMock(return_value=1000)) as mock:
+            res = self.client.head("/movies?estimate=true")
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.headers["X-Total-Count"], "1000")
+        mock.assert_called_once_with(estimate=True)
 
     @patch('model.Movies.get_movie', MagicMock(return_value=Movies(title="Movie Title", release_date="2022-01-01")))
     def test_get_movie(self):
@@ -288,5 +318,520 @@ class CreateAppTestCase(unittest.TestCase):
         self.assertTrue(data["actor_id"])
         self.assertTrue(data["movie_id"])
 
+    # Denormalized summaries
+    def _create_associated(self):
+        """Save an actor associated with a movie, both removed again after the test"""
+        actor = Actors(name="Summary Actor", age=27, gender="male")
+        movie = Movies(title="Summary Movie", release_date=datetime(2022, 1, 1))
+        actor.insert()
+        movie.insert()
+        actor.create_association(movie)
+        actor_id, movie_id = actor.id, movie.id
+
+        def cleanup():
+            db.session.rollback()
+            for row in (Actors.get_actor(actor_id), Movies.get_movie(movie_id)):
+                if row is not None:
+                    row.delete()
+        self.addCleanup(cleanup)
+        return actor, movie
+
+    def test_rename_movie_updates_filmography(self):
+        """Test renaming a movie refreshes the movie titles of its actors"""
+        actor, movie = self._create_associated()
+        movie.title = "Renamed Movie"
+        movie.update()
+        db.session.expire_all()
+
+        self.assertEqual(Actors.get_actor(actor.id).format()["movies"], ["Renamed Movie"])
+
+    def test_rename_actor_updates_cast(self):
+        """Test renaming an actor refreshes the cast names of its movies"""
+        actor, movie = self._create_associated()
+        actor.name = "Renamed Actor"
+        actor.update()
+        db.session.expire_all()
+
+        self.assertEqual(Movies.get_movie(movie.id).format()["actors"], ["Renamed Actor"])
+
+    def test_create_association_saves_summaries(self):
+        """Test a saved association is reflected in both stored summaries"""
+        actor, movie = self._create_associated()
+        db.session.expire_all()
+
+        self.assertEqual(Actors.get_actor(actor.id).format()["movies"], ["Summary Movie"])
+        self.assertEqual(Movies.get_movie(movie.id).format()["cast_count"], 1)
+
+    def test_concurrent_associations_keep_summaries(self):
+        """Test two actors associated with one movie at the same time both end up in its summary"""
+        actor, movie = self._create_associated()
+        others = [Actors(name=name, age=30, gender="female") for name in ("Summary Ann", "Summary Bob")]
+        for other in others:
+            other.insert()
+            self.addCleanup(lambda id=other.id: Actors.get_actor(id).delete())
+        ids = [other.id for other in others]
+        start = threading.Barrier(2)
+        errors = []
+
+        def associate(actor_id):
+            with self.app.app_context():
+                try:
+                    other, other_movie = Actors.get_actor(actor_id), Movies.get_movie(movie.id)
+                    other_movie.format()
+                    start.wait()
+                    other.create_association(other_movie)
+                except Exception as e:
+                    errors.append(e)
+        threads = [threading.Thread(target=associate, args=(id,)) for id in ids]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        db.session.expire_all()
+        formatted = Movies.get_movie(movie.id).format()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(sorted(formatted["actors"]), ["Summary Actor", "Summary Ann", "Summary Bob"])
+        self.assertEqual(formatted["cast_count"], 3)
+
+    def test_delete_movie_updates_filmography(self):
+        """Test deleting a movie removes it from the movie titles of its actors"""
+        actor, movie = self._create_associated()
+        movie.delete()
+        db.session.expire_all()
+        formatted = Actors.get_actor(actor.id).format()
+
+        self.assertEqual(formatted["movies"], [])
+        self.assertEqual(formatted["movie_count"], 0)
+
+    def test_delete_actor_updates_cast(self):
+        """Test deleting an actor removes them from the cast names of their movies"""
+        actor, movie = self._create_associated()
+        actor.delete()
+        db.session.expire_all()
+        formatted = Movies.get_movie(movie.id).format()
+
+        self.assertEqual(formatted["actors"], [])
+        self.assertEqual(formatted["cast_count"], 0)
+
+    def test_rebuild_summaries_keeps_updated_at(self):
+        """Test rebuilding summaries doesn't mark every row as updated for exports"""
+        actor, movie = self._create_associated()
+        updated_at = datetime(2000, 1, 1)
+        db.session.execute(db.update(Actors).where(Actors.id == actor.id).values(updated_at=updated_at))
+        db.session.execute(db.update(Movies).where(Movies.id == movie.id).values(updated_at=updated_at))
+        rebuild_summaries()
+        db.session.expire_all()
+
+        self.assertEqual(Actors.get_actor(actor.id).updated_at, updated_at)
+        self.assertEqual(Movies.get_movie(movie.id).updated_at, updated_at)
+        self.assertEqual(Movies.get_movie(movie.id).format()["actors"], ["Summary Actor"])
+
+    def test_get_changes_holds_back_recent(self):
+        """Test recent changes are held back for the safety window and then served once"""
+        actor, movie = self._create_associated()
+        since = Changes.get_latest_seq() - 2
+        actor.age = 28
+        actor.update()
+
+        self.assertEqual(Changes.get_changes(since, safety_window=60), [])
+        changes = Changes.get_changes(since, safety_window=0)
+        self.assertEqual([(c.table_name, c.row_id) for c in changes],
+                         [("movies", movie.id), ("actors", actor.id)])
+
+    # Bulk import
+    def test_read_records(self):
+        """Test CSV and NDJSON records are streamed as dicts"""
+        with tempfile.TemporaryDirectory() as tmp:
+            csv_path = os.path.join(tmp, "actors.csv")
+            ndjson_path = os.path.join(tmp, "movies.ndjson")
+            with open(csv_path, "w") as f:
+                f.write("name,age,gender\nJohn Doe,27,male\nJane Doe,54,female\n")
+            with open(ndjson_path, "w") as f:
+                f.write('{"title": "Movie Title", "release_date": "2022-01-01"}\n\n')
+
+            actors = list(read_records(csv_path))
+            movies = list(read_records(ndjson_path))
+
+        self.assertEqual(actors[1], {"name": "Jane Doe", "age": "54", "gender": "female"})
+        self.assertEqual(movies, [{"title": "Movie Title", "release_date": "2022-01-01"}])
+        self.assertEqual(list(batched(range(5), 2)), [[0, 1], [2, 3], [4]])
+
+    def test_import_files(self):
+        """Test CSV and NDJSON files are imported with links, summaries and change entries"""
+        seq = Changes.get_latest_seq()
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = {
+                "actors": os.path.join(tmp, "actors.csv"),
+                "movies": os.path.join(tmp, "movies.ndjson"),
+                "associations": os.path.join(tmp, "associations.csv")
+            }
+            with open(paths["actors"], "w", encoding="utf-8") as f:
+                f.write("name,age,gender\nImport Zoë,27,female\nImport Dup,40,male\nImport Dup,50,male\n")
+            with open(paths["movies"], "w", encoding="utf-8") as f:
+                f.write('{"title": "Import Movie", "release_date": "2022-01-01"}\n')
+            with open(paths["associations"], "w", encoding="utf-8") as f:
+                f.write("actor_name,movie_title\nImport Zoë,Import Movie\nImport Dup,Import Movie\n"
+                        "Import Nobody,Import Movie\nImport Zoë,Import Movie\n")
+            import_files(paths, batch_size=2, report=lambda message: None)
+            actors = db.session.query(Actors).filter(Actors.name.like("Import %")).order_by(Actors.id).all()
+            movie = db.session.query(Movies).filter(Movies.title == "Import Movie").one()
+            for row in actors + [movie]:
+                self.addCleanup(row.delete)
+            # Linking the same pairs again adds nothing
+            import_files({"associations": paths["associations"]}, report=lambda message: None)
+            db.session.expire_all()
+
+        self.assertEqual([(a.name, a.age) for a in actors], [("Import Zoë", 27), ("Import Dup", 40), ("Import Dup", 50)])
+        self.assertEqual(movie.release_date, datetime(2022, 1, 1))
+        self.assertEqual(sorted(a.id for a in movie.actors), [actors[0].id, actors[1].id])
+        self.assertEqual(sorted(movie.format()["actors"]), ["Import Dup", "Import Zoë"])
+        self.assertEqual(actors[0].format()["movies"], ["Import Movie"])
+        self.assertEqual(actors[2].format()["movie_count"], 0)
+        changes = {(c.table_name, c.row_id) for c in Changes.get_changes(seq, safety_window=0)}
+        self.assertEqual(changes, {("actors", a.id) for a in actors} | {("movies", movie.id)})
+
+    def test_import_data_command(self):
+        """Test import-data command passes the given files to the importer"""
+        with tempfile.NamedTemporaryFile(suffix=".csv") as f, \
+                patch('app.import_files', MagicMock(return_value=None)) as mock:
+            res = self.app.test_cli_runner().invoke(args=["import-data", "--actors", f.name])
+
+        self.assertEqual(res.exit_code, 0)
+        mock.assert_called_once_with(
+            {"actors": f.name, "movies": None, "associations": None}, batch_size=1000)
+
+    # Bulk export
+    @patch('bulk.export_rows', MagicMock(return_value=iter([[(1, "John Doe", 27, "male")]])))
+    def test_export_actors(self):
+        """Test export route streams a gzipped CSV download"""
+        res = self.client.get("/export/actors?gzip=true")
+        lines = gzip.decompress(res.data).decode().splitlines()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.headers["Content-Type"], "application/gzip")
+        self.assertEqual(lines, ["id,name,age,gender", "1,John Doe,27,male"])
+
+    def test_export_rows_filters(self):
+        """Test exports filter by id watermark and change time against the test database"""
+        actor, movie = self._create_associated()
+        old = datetime(2000, 1, 1)
+        db.session.execute(db.update(Actors).where(Actors.id == actor.id).values(updated_at=old))
+        db.session.commit()
+
+        def exported(kind, **filters):
+            return [row for rows in export_rows(kind, **filters) for row in rows]
+
+        self.assertEqual([row[0] for row in exported("actors", after_id=actor.id - 1)], [actor.id])
+        self.assertIn(actor.id, [row[0] for row in exported("actors", since=datetime(1999, 1, 1))])
+        self.assertNotIn(actor.id, [row[0] for row in exported("actors", since=datetime(2001, 1, 1))])
+        self.assertIn((movie.id, actor.id), exported("movie_actors", since=datetime(2001, 1, 1)))
+        db.session.execute(db.update(movie_actors).where(movie_actors.c.actor_id == actor.id).values(created_at=old))
+        db.session.commit()
+        self.assertNotIn((movie.id, actor.id), exported("movie_actors", since=datetime(2001, 1, 1)))
+        with self.assertRaises(ValueError):
+            exported("movie_actors", after_id=1)
+
+    def test_export_movie_actors_after_id(self):
+        """Test export route rejects an id watermark for movie_actors"""
+        res = self.client.get("/export/movie_actors?after_id=5")
+        cli = self.app.test_cli_runner().invoke(args=["export-data", "movie_actors", "--after-id", "5"])
+
+        self.assertEqual(res.status_code, 400)
+        self.assertNotEqual(cli.exit_code, 0)
+        self.assertIn("--after-id", cli.output)
+
+    def test_export_actors_failure(self):
+        """Test export route rejects unknown formats"""
+        res = self.client.get("/export/actors?format=xml")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data["message"], "Bad request")
+
+    # Change feed
+    @patch('model.Changes.get_changes',
+           MagicMock(return_value=[Changes(seq=5, table_name="actors", row_id=1, deleted=False),
+                                   Changes(seq=6, table_name="movies", row_id=2, deleted=True)]))
+    @patch('model.Actors.get_actors', MagicMock(return_value=[Actors(name="John Doe", age=27, gender="male")]))
+    @patch('model.Movies.get_movies', MagicMock(return_value=[]))
+    def test_get_changes(self):
+        """Test change feed route returns changed rows, tombstones and the next cursor"""
+        Actors.get_actors.return_value[0].id = 1
+        res = self.client.get("/changes?since=4")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["success"], True)
+        self.assertEqual(data["next"], 6)
+        self.assertEqual(data["changes"][0]["row"]["name"], "John Doe")
+        self.assertTrue(data["changes"][1]["deleted"])
+        self.assertNotIn("row", data["changes"][1])
+
+    # Compression
+    @patch('model.Actors.get_all_actors',
+           MagicMock(return_value=[Actors(name=f"Actor {i}", age=30, gender="male") for i in range(50)]))
+    def test_get_actors_gzip(self):
+        """Test large responses are gzipped when the client accepts it"""
+        res = self.client.get("/actors", headers={"Accept-Encoding": "gzip"})
+        data = json.loads(gzip.decompress(res.data))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.headers["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", res.headers["Vary"])
+        self.assertEqual(len(data["actors"]), 50)
+
+    def test_index_route_not_gzipped(self):
+        """Test small responses are sent uncompressed"""
+        res = self.client.get("/", headers={"Accept-Encoding": "gzip"})
+
+        self.assertNotIn("Content-Encoding", res.headers)
+        self.assertEqual(json.loads(res.data)["message"], "Welcome to Casting Agency")
+
+    # Admission control
+    @patch('admission.ConcurrencyLimiter.acquire', MagicMock(return_value=False))
+    def test_get_actors_shed(self):
+        """Test requests beyond the concurrency limit fail fast with a 503"""
+        res = self.client.get("/actors")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(data["message"], "Service unavailable")
+        self.assertTrue(res.headers["Retry-After"])
+
+    def test_concurrency_limiter(self):
+        """Test the limiter queues up to its queue size and counts rejections"""
+        limiter = ConcurrencyLimiter(limit=1, queue_size=1, timeout=0.5)
+        self.assertTrue(limiter.acquire())
+
+        # A second request waits in the queue until the slot is released
+        results = []
+        waiter = threading.Thread(target=lambda: results.append(limiter.acquire()))
+        waiter.start()
+        deadline = time.monotonic() + 1
+        while limiter.format()["waiting"] == 0 and time.monotonic() < deadline:
+            time.sleep(0.001)
+        self.assertEqual(limiter.format()["waiting"], 1)
+        self.assertFalse(limiter.acquire())
+        limiter.release()
+        waiter.join()
+        self.assertEqual(results, [True])
+
+        # With the slot still taken and nobody releasing it, the next request times out
+        self.assertFalse(limiter.acquire())
+
+        stats = limiter.format()
+        self.assertEqual(stats["active"], 1)
+        self.assertEqual(stats["waiting"], 0)
+        self.assertEqual(stats["admitted"], 2)
+        self.assertEqual(stats["timed_out"], 1)
+        self.assertEqual(stats["rejected"], 1)
+
+    def test_get_admission(self):
+        """Test admission route reports every route class"""
+        res = self.client.get("/admission")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(set(data["admission"]), {"read", "write", "associate"})
+
+    # Request coalescing
+    def test_get_movies_coalesced(self):
+        """Test identical concurrent reads share a single fetch"""
+        def get_all_movies():
+            time.sleep(0.2)
+            return [Movies(title="Movie Title", release_date="2022-01-01")]
+
+        responses = []
+        def get_movies():
+            responses.append(self.app.test_client().get("/movies"))
+
+        with patch('model.Movies.get_all_movies', MagicMock(side_effect=get_all_movies)) as mock:
+            threads = [threading.Thread(target=get_movies) for _ in range(5)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(mock.call_count, 1)
+        self.assertEqual([res.status_code for res in responses], [200] * 5)
+        self.assertEqual(len({res.data for res in responses}), 1)
+
+    # JSON provider
+    @patch('model.Movies.get_movie', MagicMock(return_value=Movies(title="Movie Title", release_date=datetime(2022, 1, 1))))
+    def test_get_movie_iso_dates(self):
+        """Test dates are serialized as compact ISO 8601"""
+        res = self.client.get("/movies/1")
+        data = json.loads(res.data)
+
+        self.assertEqual(data["movie"]["release_date"], "2022-01-01T00:00:00")
+        self.assertNotIn(b", ", res.data)
+
+    @patch('json_provider.orjson', None)
+    def test_json_provider_without_orjson(self):
+        """Test the provider falls back to the standard library encoder"""
+        res = self.app.json.response({"release_date": datetime(2022, 1, 1), "name": "Zoë"})
+
+        self.assertEqual(res.get_data(), '{"release_date":"2022-01-01T00:00:00","name":"Zoë"}'.encode())
+
+    # Access log
+    @patch('model.Actors.get_actor', MagicMock(return_value=Actors(name="John Doe", age=27, gender="male")))
+    def test_access_log(self):
+        """Test requests are written to the access log by the background writer"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "access.log")
+            access_log = setup_access_log(self.app, path)
+            self.client.get("/actors/1")
+            access_log.close()
+            with open(path) as f:
+                records = [json.loads(line) for line in f]
+
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]["route"], "/actors/<int:actor_id>")
+        self.assertEqual(records[0]["status"], 200)
+        self.assertEqual(records[0]["actor_id"], 1)
+
+    def test_access_log_drops_when_full(self):
+        """Test records are dropped and counted instead of blocking when the queue is full"""
+        writer_ready = threading.Event()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "access.log")
+            access_log = AccessLog(path, queue_size=2)
+            run = access_log._run
+            access_log._run = lambda: (writer_ready.wait(), run())
+            for i in range(5):
+                access_log.log({"status": 200, "request": i})
+            writer_ready.set()
+            access_log.close()
+            with open(path) as f:
+                records = [json.loads(line) for line in f]
+
+        self.assertEqual(access_log.dropped, 3)
+        self.assertEqual([r.get("request") for r in records[:2]], [0, 1])
+        self.assertEqual(records[2], {"event": "dropped", "count": 3})
+
+    def test_access_log_survives_write_errors(self):
+        """Test a failed write is counted and the writer keeps going with a fresh file"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "logs", "access.log")
+            access_log = AccessLog(path)
+            access_log.log({"status": 200, "request": 0})
+            deadline = time.monotonic() + 1
+            while access_log.failed == 0 and time.monotonic() < deadline:
+                time.sleep(0.001)
+            os.mkdir(os.path.dirname(path))
+            access_log.log({"status": 200, "request": 1})
+            access_log.close()
+            with open(path) as f:
+                records = [json.loads(line) for line in f]
+
+        self.assertEqual(access_log.failed, 1)
+        self.assertEqual(records, [{"status": 200, "request": 1}, {"event": "write_failed", "count": 1}])
+
+    def test_access_log_close_with_dead_writer(self):
+        """Test closing doesn't block when the writer thread is gone and the queue is full"""
+        with tempfile.TemporaryDirectory() as tmp:
+            access_log = AccessLog(os.path.join(tmp, "access.log"), queue_size=1)
+            access_log._run = lambda: None
+            access_log.log({"status": 200})
+            access_log._thread.join()
+            access_log.log({"status": 200})
+            start = time.monotonic()
+            access_log.close(timeout=0.1)
+
+        self.assertLess(time.monotonic() - start, 1)
+
+    # Stats
+    def test_get_cast_sizes(self):
+        """Test cast sizes stats route is served from cache on repeat requests"""
+        cast_sizes = [{"movie_id": 1, "title": "Movie Title", "cast_size": 2}]
+        with patch('model.Movies.get_cast_sizes', MagicMock(return_value=cast_sizes)) as mock:
+            res = self.client.get("/stats/cast-sizes")
+            self.client.get("/stats/cast-sizes")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["success"], True)
+        self.assertEqual(data["cast_sizes"], cast_sizes)
+        mock.assert_called_once()
+
+    @patch('model.Actors.get_age_distribution',
+           MagicMock(return_value={"male": [{"min_age": 20, "max_age": 29, "actors": 3}]}))
+    def test_get_age_distribution(self):
+        """Test age distribution stats route"""
+        res = self.client.get("/stats/age-distribution")
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["success"], True)
+        self.assertEqual(data["age_distribution"]["male"][0]["actors"], 3)
+
+    # Snapshot
+    def test_snapshot(self):
+        """Test a written snapshot serves the same reads as the database"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "catalog.snap")
+            write_snapshot(path,
+                [(1, "Actor Name", 30, "male"), (4, "Ängel", 25, "female")],
+                [(2, "Movie Title", datetime(2020, 5, 17)), (3, "Other", datetime(1999, 1, 1))],
+                [(2, 1), (2, 4), (3, 4)],
+                seq=7)
+            snapshot = Snapshot(path)
+
+            self.assertEqual(snapshot.seq, 7)
+            self.assertEqual(snapshot.get_actor(4), {"id": 4, "name": "Ängel", "age": 25, "gender": "female",
+                                                     "movies": ["Movie Title", "Other"], "movie_count": 2})
+            self.assertEqual(snapshot.get_movie(2), {"id": 2, "title": "Movie Title",
+                                                     "release_date": datetime(2020, 5, 17),
+                                                     "actors": ["Actor Name", "Ängel"], "cast_count": 2})
+            self.assertIsNone(snapshot.get_actor(2))
+            self.assertEqual([m["id"] for m in snapshot.get_all_movies()], [2, 3])
+
+    def test_snapshot_rebuild_skipped_when_current(self):
+        """Test a rebuild is skipped while another process holds the lock or the snapshot is current"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "catalog.snap")
+            rebuilder = SnapshotRebuilder(self.app, path, delay=0)
+            write_snapshot(path, [], [], [], seq=10)
+            with patch('snapshot.build_snapshot') as build, \
+                    patch('model.Changes.get_settled_seq', MagicMock(return_value=10)):
+                with open(f"{path}.lock", "w") as lock:
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+                    self.assertFalse(rebuilder._build())
+                self.assertTrue(rebuilder._build())
+                build.assert_not_called()
+            with patch('snapshot.build_snapshot') as build, \
+                    patch('model.Changes.get_settled_seq', MagicMock(return_value=11)):
+                self.assertTrue(rebuilder._build())
+                build.assert_called_once_with(path)
+
+    def test_recorded_and_settled_seq(self):
+        """Test a write learns its own seq and recent seqs don't count as settled"""
+        actor, movie = self._create_associated()
+        Changes.get_recorded_seq()
+        actor.age = 28
+        actor.update()
+        seq = db.session.query(Changes.seq).filter_by(table_name="actors", row_id=actor.id).scalar()
+
+        self.assertEqual(Changes.get_recorded_seq(), seq)
+        self.assertEqual(Changes.get_recorded_seq(), 0)
+        self.assertLess(Changes.get_settled_seq(safety_window=60), seq)
+        self.assertEqual(Changes.get_settled_seq(safety_window=0), Changes.get_latest_seq())
+
+    def test_snapshot_store(self):
+        """Test the store swaps in a replaced snapshot and skips it after a newer write"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "catalog.snap")
+            store = SnapshotStore(path, check_interval=0)
+            self.assertIsNone(store.current())
+
+            write_snapshot(path, [(1, "Old", 30, "male")], [], [], seq=1)
+            self.assertEqual(store.current().get_actor(1)["name"], "Old")
+            store.written(2)
+            self.assertIsNone(store.current())
+
+            write_snapshot(path, [(1, "New", 30, "male")], [], [], seq=2)
+            self.assertEqual(store.current().get_actor(1)["name"], "New")
+
 if __name__ == "__main__":
     unittest.main()